@@ -1,6 +1,5 @@
 import streamlit as st
 import pandas as pd
-import openpyxl
 from io import BytesIO
 
 # 데이터 처리 함수
@@ -52,6 +51,8 @@ st.markdown("""
 uploaded_file = st.file_uploader("📤 엑셀 파일 업로드", type=["xlsx"], accept_multiple_files=False)
 
 if uploaded_file:
+    # openpyxl은 파일이 올라왔을 때만 불러옴 (pandas는 streamlit이 이미 불러옴)
+    import openpyxl
     st.success(f"업로드된 파일: {uploaded_file.name}")
     with st.spinner("파일 처리 중... 잠시만 기다려 주세요 ⏳"):
         workbook = openpyxl.load_workbook(uploaded_file)
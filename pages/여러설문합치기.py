@@ -1,8 +1,25 @@
 import streamlit as st
 import pandas as pd
+import codecs
+import functools
 import re
 from io import BytesIO
 
+# 인코딩 판별에 사용할 앞부분 크기
+ENCODING_SNIFF_BYTES = 64 * 1024
+CSV_ENCODINGS = ["utf-8-sig", "cp949"]
+
+STUDENT_ID_PATTERN = re.compile(r'\d{5}')
+
+@functools.lru_cache(maxsize=None)
+def get_csv_engine():
+    # pyarrow가 설치되어 있으면 멀티스레드 CSV 파서 사용 (처음 CSV를 읽을 때 확인)
+    try:
+        import pyarrow  # noqa: F401
+        return "pyarrow"
+    except ImportError:
+        return "c"
+
 # 학번 추출 함수
 def extract_student_id(value):
     """
@@ -10,9 +27,93 @@ def extract_student_id(value):
     :param value: 문자열
     :return: 연속된 5자리 숫자 (학번) 또는 None
     """
-    match = re.search(r'\d{5}', str(value))  # 연속된 5자리 숫자 찾기 (문자와 숫자가 붙어 있어도 동작)
+    match = STUDENT_ID_PATTERN.search(str(value))  # 연속된 5자리 숫자 찾기 (문자와 숫자가 붙어 있어도 동작)
     return match.group(0) if match else None
 
+# CSV 인코딩 판별 함수
+def sniff_encoding(raw):
+    """
+    파일 앞부분만 디코딩해 보고 인코딩을 추정합니다.
+    구글 설문(UTF-8, BOM 포함)과 나이스(CP949) 내보내기를 구분합니다.
+    :param raw: 파일 앞부분 바이트
+    :return: pandas에 넘길 인코딩 이름, 앞부분이 모두 ASCII라 구분할 수 없으면 None
+    """
+    if raw.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if raw.isascii():
+        # 한글이 앞부분 뒤에서 처음 나오는 파일은 어느 인코딩으로도 디코딩되므로 판별을 미룹니다.
+        return None
+    for encoding in CSV_ENCODINGS:
+        try:
+            raw.decode(encoding)
+            return encoding
+        except UnicodeDecodeError as e:
+            # 앞부분을 자르다 멀티바이트 글자 중간에서 끊긴 경우는 정상으로 봅니다.
+            if e.start >= len(raw) - 3 and e.reason == "unexpected end of data":
+                return encoding
+    return CSV_ENCODINGS[-1]
+
+def read_csv_file(file, **kwargs):
+    """
+    인코딩을 판별해 CSV를 읽습니다.
+    앞부분만으로 판별하지 못했으면 UTF-8로 읽어 보고, 디코딩 오류가 나면 CP949로 다시 읽습니다.
+    :param file: 업로드된 CSV 파일
+    :param kwargs: pd.read_csv에 넘길 인자
+    :return: 데이터프레임
+    """
+    encoding = sniff_encoding(file.getvalue()[:ENCODING_SNIFF_BYTES])
+    candidates = [encoding] if encoding else CSV_ENCODINGS
+    for idx, candidate in enumerate(candidates):
+        file.seek(0)
+        try:
+            return pd.read_csv(file, encoding=candidate, **kwargs)
+        except UnicodeDecodeError:
+            if idx == len(candidates) - 1:
+                raise
+
+def read_header(file):
+    """
+    파일의 열 이름만 읽습니다. (본문은 파싱하지 않음)
+    :param file: 업로드된 파일
+    :return: 열 이름 리스트
+    """
+    file.seek(0)
+    if file.name.endswith('.csv'):
+        columns = read_csv_file(file, nrows=0).columns
+    else:
+        columns = pd.read_excel(file, nrows=0).columns
+    file.seek(0)
+    return list(columns)
+
+def has_duplicate_header(file):
+    """
+    CSV 머리글에 같은 열 이름이 두 번 이상 있는지 확인합니다.
+    구글 설문은 같은 질문 제목이 반복되는 경우가 많습니다.
+    :param file: 업로드된 CSV 파일
+    :return: 중복된 열 이름이 있으면 True
+    """
+    header = read_csv_file(file, header=None, nrows=1).iloc[0]
+    file.seek(0)
+    return header.duplicated().any()
+
+def read_table(file, usecols=None):
+    """
+    필요한 열만 읽어 데이터프레임으로 반환합니다.
+    CSV는 pyarrow가 있으면 멀티스레드로 읽습니다.
+    :param file: 업로드된 파일
+    :param usecols: 읽을 열 이름 리스트 (None이면 전체, read_header가 돌려준 열 이름 기준)
+    :return: 데이터프레임
+    """
+    file.seek(0)
+    if not file.name.endswith('.csv'):
+        return pd.read_excel(file, usecols=usecols)
+
+    engine = get_csv_engine()
+    if engine == "pyarrow" and has_duplicate_header(file):
+        # pyarrow 엔진은 중복된 열 이름을 'Q.1'처럼 바꿔주지 않아 read_header와 열 이름이 달라짐
+        engine = "c"
+    return read_csv_file(file, usecols=usecols, engine=engine)
+
 # 제목 및 소개
 st.title("📊 구글 설문 응답 통합 앱")
 
@@ -49,28 +150,24 @@ if uploaded_files:
         st.write("---")
         st.write(f"파일: **{file.name}**")
         
-        # 파일 읽기
+        # 열 이름만 먼저 읽기
+        if not file.name.endswith(('.csv', '.xls', '.xlsx')):
+            st.warning(f"지원되지 않는 파일 형식입니다: {file.name}")
+            continue
         try:
-            if file.name.endswith('.csv'):
-                df = pd.read_csv(file)
-            elif file.name.endswith(('.xls', '.xlsx')):
-                df = pd.read_excel(file)
-            else:
-                st.warning(f"지원되지 않는 파일 형식입니다: {file.name}")
-                continue
+            raw_columns = read_header(file)
         except Exception as e:
             st.error(f"{file.name} 파일을 읽는 중 오류 발생: {e}")
             continue
         
         # 열 이름에서 파일명 제거 (파일 이름 접두사 제거)
-        original_columns = [col.split("_", 1)[-1] for col in df.columns]
-        df.columns = original_columns
+        original_columns = [str(col).split("_", 1)[-1] for col in raw_columns]
         
         # 키 열 선택
         key_col = st.selectbox(
             f"**{file.name}**에서 키로 사용할 열을 선택하세요.",
-            df.columns,
-            index=1 if len(df.columns) > 1 else 0,  # 기본값: 두 번째 열
+            original_columns,
+            index=1 if len(original_columns) > 1 else 0,  # 기본값: 두 번째 열
             key=file.name + "_key"
         )
         key_columns[file.name] = key_col
@@ -80,24 +177,34 @@ if uploaded_files:
             f"**{file.name}**에서 학번 추출(다섯 자리 숫자)",
             key=file.name + "_extract"
         )
-        
-        if extract_checkbox:
-            # 학번 열 추가 (체크박스가 체크된 경우 학번 추출)
-            df["학번"] = df[key_col].apply(extract_student_id)
-            merge_key = "학번"  # 병합 기준: 학번
-        else:
-            # 체크박스가 체크되지 않은 경우 기존 키 열을 사용
-            df["학번"] = df[key_col]  # 기존 키 열을 '학번' 열로 대체
-            merge_key = key_col  # 병합 기준: 기존 키 열
         st.write(key_col)
         # 병합할 응답 열 선택
         columns_to_merge = st.multiselect(
             f"**{file.name}**에서 병합할 응답 열을 선택하세요.",
-            [col for col in df.columns if col != key_col],  # 키 열 제외
+            [col for col in original_columns if col != key_col],  # 키 열 제외
             key=file.name + "_cols"
         )
 
         if columns_to_merge:
+            # 키 열과 선택한 응답 열만 읽기
+            selected = [key_col] + columns_to_merge
+            usecols = [raw for raw, col in zip(raw_columns, original_columns) if col in selected]
+            try:
+                df = read_table(file, usecols=usecols)
+            except Exception as e:
+                st.error(f"{file.name} 파일을 읽는 중 오류 발생: {e}")
+                continue
+            df.columns = [str(col).split("_", 1)[-1] for col in df.columns]
+
+            if extract_checkbox:
+                # 학번 열 추가 (체크박스가 체크된 경우 학번 추출)
+                df["학번"] = df[key_col].apply(extract_student_id)
+                merge_key = "학번"  # 병합 기준: 학번
+            else:
+                # 체크박스가 체크되지 않은 경우 기존 키 열을 사용
+                df["학번"] = df[key_col]  # 기존 키 열을 '학번' 열로 대체
+                merge_key = key_col  # 병합 기준: 기존 키 열
+
             # 응답 병합 함수
             def combine_responses(row):
                 pairs = []
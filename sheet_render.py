@@ -0,0 +1,397 @@
+"""4단계 반별 시트 렌더링
+
+작업 프로세스에서 실행되어야 하므로 streamlit에 의존하지 않는 별도 모듈로 둡니다.
+(streamlit_app.py는 스크립트로 실행되어 작업 프로세스에서 import할 수 없음)
+"""
+import functools
+import multiprocessing
+import re
+import sys
+import threading
+import time
+import types
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from io import BytesIO
+from xml.sax.saxutils import quoteattr
+
+import pandas as pd
+
+# 반별 시트를 나눠 그릴 때 시트가 이보다 적으면 한 번에 그림
+MIN_PARALLEL_SHEETS = 2
+
+# 작업 프로세스 시작 방식: 스레드가 많은 서버 프로세스를 fork하지 않도록 forkserver(없으면 spawn) 사용
+RENDER_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+RENDER_PRELOAD = ["sheet_render", "pandas", "openpyxl"]
+
+# 결과를 기다리는 동안 진행 상황(취소 요청)을 확인하는 간격과, 시트가 하나도 끝나지 않을 때 포기하는 시간(초)
+RENDER_POLL_INTERVAL = 0.5
+RENDER_STALL_TIMEOUT = 300
+
+# openpyxl이 저장한 시트 하나짜리 통합문서의 파일 위치
+PART_SHEET = "xl/worksheets/sheet1.xml"
+PART_SHEET_RELS = "xl/worksheets/_rels/sheet1.xml.rels"
+PART_SHARED_STRINGS = "xl/sharedStrings.xml"
+PART_STYLES = "xl/styles.xml"
+PART_WORKBOOK = "xl/workbook.xml"
+PART_WORKBOOK_RELS = "xl/_rels/workbook.xml.rels"
+PART_CONTENT_TYPES = "[Content_Types].xml"
+
+SHARED_STRING_CELL_PATTERN = re.compile(r'(<c\b[^>]*\bt="s"[^>]*>\s*<v>)(\d+)(</v>)')
+SHARED_STRING_ITEM_PATTERN = re.compile(r'<si>.*?</si>', re.S)
+TAB_SELECTED_PATTERN = re.compile(r'\s+tabSelected="1"')
+SHEETS_PATTERN = re.compile(r'<sheets>.*?</sheets>', re.S)
+SHEET_REL_PATTERN = re.compile(r'<Relationship\b[^>]*Target="/?(?:xl/)?worksheets/sheet1\.xml"[^>]*/>')
+SHEET_OVERRIDE_PATTERN = re.compile(r'<Override\b[^>]*PartName="/xl/worksheets/sheet1\.xml"[^>]*/>')
+
+NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+WORKSHEET_REL_TYPE = f"{NS_REL}/worksheet"
+WORKSHEET_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def get_excel_styles():
+    # 4단계 서식에 쓰는 스타일 객체 (한 번만 만들어 모든 시트에서 공유)
+    from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+    return {
+        "yellow_fill": PatternFill(start_color="FFFF99", end_color="FFFF99", fill_type="solid"),
+        "red_fill": PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid"),
+        "bold_font": Font(size=14, bold=True),
+        "large_bold_font": Font(size=20, bold=True),  # 20포인트 굵은 글씨 추가
+        "center_alignment": Alignment(horizontal="center", vertical="center"),
+        "wrap_alignment": Alignment(wrap_text=True),
+        "wrap_center_alignment": Alignment(wrap_text=True, vertical="center"),
+        "thin_border": Border(
+            left=Side(style='thin'),
+            right=Side(style='thin'),
+            top=Side(style='thin'),
+            bottom=Side(style='thin')
+        ),
+    }
+
+
+def style_class_sheet(writer, section_name, sheet_name, group_df):
+    # 반 하나의 시트를 쓰고 수식과 서식을 적용
+    from openpyxl.utils import get_column_letter
+    from openpyxl.formatting.rule import CellIsRule
+
+    group_df.to_excel(writer, index=False, sheet_name=sheet_name)
+
+    wb = writer.book
+    ws = wb[sheet_name]
+
+    # 열 고정 및 시작 컬럼 설정
+    ws.freeze_panes = "E2"
+    start_col = 5
+    num_cols = len(group_df.columns) - start_col + 1
+    additional_col = start_col + num_cols
+    combine_col_index = additional_col + 1
+    byte_col_index = combine_col_index + 1
+
+    # 특기사항 합본 및 바이트 계산 수식 추가
+    # '이름' 열에서 마지막 유효 행 찾기
+    name_col_letter = get_column_letter(group_df.columns.get_loc("이름") + 1)  # '이름' 열의 열 문자
+    last_name_row = max(
+        row.row for row in ws[name_col_letter] if row.value  # '이름' 열의 유효 값이 있는 행을 찾음
+    )
+
+    # 특기사항 합본 및 바이트 계산 수식 추가 (마지막 유효 행까지만 적용)
+    for idx in range(2, last_name_row + 1):  # 범위를 '이름' 열의 마지막 유효 행으로 제한
+        concat_formula = "=" + "CONCATENATE(" + ",".join(
+            [f"{get_column_letter(start_col + num_cols)}{idx}"] +  # 마지막 열 먼저 추가
+            [f"{get_column_letter(col)}{idx}" for col in range(start_col, start_col + num_cols)]  # 나머지 열 추가
+        ) + ")"
+        ws[f"{get_column_letter(combine_col_index)}{idx}"] = concat_formula
+        ws[f"{get_column_letter(byte_col_index)}{idx}"] = (
+            f'=LENB({get_column_letter(combine_col_index)}{idx})*2-LEN({get_column_letter(combine_col_index)}{idx})'
+        )
+
+    if section_name == "자율활동":
+        ws[f"{get_column_letter(additional_col)}1"] = "비고(학급임원파일과 학급활동 등은 수기로 추가해주세요. 마지막 온점 뒤 띄어쓰기 필수!)"
+    elif section_name == "진로활동":
+        ws[f"{get_column_letter(additional_col)}1"] = "비고(수기로 추가할 내용을 작성해주세요. 마지막 온점 뒤 띄어쓰기 필수!)"
+
+    # 열 이름 설정
+    # ws[f"{get_column_letter(additional_col)}1"] = "비고(학급임원파일과 학급활동 등은 수기로 추가해주세요. 마지막 온점 뒤 띄어쓰기 필수!)"
+    ws[f"{get_column_letter(combine_col_index)}1"] = "특기사항 합본"
+    ws[f"{get_column_letter(byte_col_index)}1"] = "바이트 계산"
+
+    # 셀 스타일 및 포맷 적용
+    styles = get_excel_styles()
+    yellow_fill = styles["yellow_fill"]
+    red_fill = styles["red_fill"]
+    bold_font = styles["bold_font"]
+    large_bold_font = styles["large_bold_font"]
+    center_alignment = styles["center_alignment"]
+
+    # 마지막 세 열(비고, 특기사항 합본, 바이트 계산) 헤더에 노란색 배경과 굵은 글씨 적용
+    remarks_col_letter = get_column_letter(additional_col)
+    combine_col_letter = get_column_letter(combine_col_index)
+    byte_col_letter = get_column_letter(byte_col_index)
+
+    for col_letter in [remarks_col_letter, combine_col_letter, byte_col_letter]:
+        ws[f"{col_letter}1"].fill = yellow_fill
+        ws[f"{col_letter}1"].font = bold_font
+        ws[f"{col_letter}1"].alignment = styles["wrap_alignment"]  # 텍스트 래핑 적용
+
+
+    # 바이트 계산 열 서식 (모든 행에 대해 적용)
+    # 모든 행에 대해 가운데 정렬, 굵게, 글씨 크기 20포인트 적용
+    for row_idx in range(2, ws.max_row + 1):
+        cell = ws[f"{byte_col_letter}{row_idx}"]
+        cell.alignment = center_alignment
+        cell.font = large_bold_font  # 20포인트 굵은 글씨
+        # 조건부 서식은 별도로 적용
+
+
+    for col_letter in [remarks_col_letter, combine_col_letter, byte_col_letter]:
+        ws[f"{col_letter}1"].fill = yellow_fill
+        ws[f"{col_letter}1"].font = bold_font
+        ws[f"{col_letter}1"].alignment = styles["wrap_alignment"]  # 텍스트 래핑 적용
+
+    if section_name == "자율활동":
+        # 자율활동: 바이트 계산이 1500 초과 시 빨간색 조건부 서식 적용
+        ws.conditional_formatting.add(
+            f"{byte_col_letter}2:{byte_col_letter}{ws.max_row}",
+            CellIsRule(operator="greaterThan", formula=["1500"], stopIfTrue=True, fill=red_fill)
+        )
+    elif section_name == "진로활동":
+        # 진로활동: 바이트 계산이 2100 초과 시 빨간색 조건부 서식 적용
+        ws.conditional_formatting.add(
+            f"{byte_col_letter}2:{byte_col_letter}{ws.max_row}",
+            CellIsRule(operator="greaterThan", formula=["2100"], stopIfTrue=True, fill=red_fill)
+        )
+
+    # 테두리 스타일 정의
+    thin_border = styles["thin_border"]
+    # 셀 높이를 2행부터 최대값으로 고정
+    # 행 높이 설정
+    # 행 높이 강제 설정
+    for row_idx in range(2, ws.max_row + 1):
+        ws.row_dimensions[row_idx].height = 300  # 최대값
+
+    # 열 너비 및 텍스트 정렬 설정
+    for col_idx in range(start_col, byte_col_index + 1):
+        col_letter = get_column_letter(col_idx)
+        if col_idx == combine_col_index:
+            ws.column_dimensions[col_letter].width = 150
+        elif col_idx == byte_col_index:
+            ws.column_dimensions[col_letter].width = 20
+        else:
+            ws.column_dimensions[col_letter].width = 50
+
+        # 셀 텍스트 줄바꿈 및 상단 정렬 + 테두리 적용
+        for row_idx in range(2, ws.max_row + 1):
+            cell = ws[f"{col_letter}{row_idx}"]
+            if cell.value:  # 값이 있는 셀에만 테두리 적용
+                cell.alignment = styles["wrap_center_alignment"]  # 텍스트 줄바꿈
+                cell.border = thin_border
+
+    # # 행 높이 자동 조절: 바이트 수에 따라 선형적으로 증가
+    # # 변환 공식: y 포인트 ≈ 0.0805 * 바이트 + 65.15
+    # for row_idx in range(2, ws.max_row + 1):
+    #     byte_value = ws[f"{byte_col_letter}{row_idx}"].value
+    #     if byte_value is not None and isinstance(byte_value, (int, float)):
+    #         # 선형 변환 공식 적용
+    #         row_height = 0.2*byte_value + 100
+    #         # 행 높이를 포인트 단위로 설정 (엑셀의 단위)
+    #         ws.row_dimensions[row_idx].height = row_height
+    #     else:
+    #         # 기본 행 높이 설정
+    #         ws.row_dimensions[row_idx].height = 15
+
+
+def render_class_sheet(section_name, sheet_name, group_df):
+    # 작업 프로세스에서 반 하나를 시트 하나짜리 통합문서(xlsx 바이트)로 렌더링
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        style_class_sheet(writer, section_name, sheet_name, group_df)
+    return output.getvalue()
+
+
+def get_render_pool(max_workers):
+    # 모든 영역이 함께 쓰는 프로세스 풀 (처음 부를 때의 max_workers로 한 번만 만듦)
+    global _pool
+    with _pool_lock:
+        if _pool is None and max_workers > 1:
+            context = multiprocessing.get_context(RENDER_START_METHOD)
+            if RENDER_START_METHOD == "forkserver":
+                context.set_forkserver_preload(RENDER_PRELOAD)
+            _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+        return _pool
+
+
+@contextmanager
+def _hidden_main_module():
+    # streamlit은 앱 스크립트를 __main__ 모듈로 등록해 둠
+    # 그대로 두면 새 작업 프로세스가 시작할 때 앱 스크립트를 다시 실행하므로, 프로세스를 띄우는 동안만 빈 모듈로 바꿈
+    main_module = sys.modules.get("__main__")
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main_module
+
+
+def _submit_all(pool, func, *iterables):
+    # 작업 프로세스는 submit 중에 필요할 때 만들어지므로 제출하는 동안 __main__을 숨김
+    with _pool_lock, _hidden_main_module():
+        return [pool.submit(func, *args) for args in zip(*iterables)]
+
+
+def _discard_render_pool(pool, terminate=False):
+    # 망가졌거나 멈춘 풀은 버리고 다음 요청 때 새로 만듦
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    if terminate:
+        # 멈춘 작업 프로세스를 직접 종료 (ProcessPoolExecutor에 공개된 방법이 없음)
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def assemble_workbook(parts):
+    """
+    시트 하나짜리 통합문서들을 하나의 통합문서로 합칩니다.
+    모든 반 시트는 같은 코드로 서식을 적용하므로 styles.xml이 같아야 하며,
+    다르거나 예상과 다른 구조이면 None을 반환합니다. (호출하는 쪽에서 순차 렌더링)
+    :param parts: (시트 이름, xlsx 바이트) 리스트
+    :return: 합쳐진 xlsx BytesIO 또는 None
+    """
+    archives = [zipfile.ZipFile(BytesIO(data)) for _, data in parts]
+    base = archives[0]
+    styles_xml = base.read(PART_STYLES)
+
+    shared_strings = []
+    sheet_xmls = []
+    for part_idx, archive in enumerate(archives):
+        names = set(archive.namelist())
+        if PART_SHEET not in names or PART_SHEET_RELS in names or archive.read(PART_STYLES) != styles_xml:
+            return None
+
+        # 공유 문자열은 이어 붙이고, 시트의 문자열 번호를 그만큼 밀어줌
+        strings = []
+        if PART_SHARED_STRINGS in names:
+            strings = SHARED_STRING_ITEM_PATTERN.findall(archive.read(PART_SHARED_STRINGS).decode("utf-8"))
+        offset = len(shared_strings)
+        shared_strings.extend(strings)
+        sheet_xml = archive.read(PART_SHEET).decode("utf-8")
+        if offset:
+            sheet_xml = SHARED_STRING_CELL_PATTERN.sub(
+                lambda m: f"{m.group(1)}{int(m.group(2)) + offset}{m.group(3)}", sheet_xml
+            )
+        if part_idx > 0:
+            # 첫 시트만 선택된 상태로 (여러 시트가 선택되면 엑셀에서 그룹 편집 모드가 됨)
+            sheet_xml = TAB_SELECTED_PATTERN.sub("", sheet_xml)
+        sheet_xmls.append(sheet_xml)
+
+    workbook_xml = base.read(PART_WORKBOOK).decode("utf-8")
+    rels_xml = base.read(PART_WORKBOOK_RELS).decode("utf-8")
+    content_types_xml = base.read(PART_CONTENT_TYPES).decode("utf-8")
+    if not (SHEETS_PATTERN.search(workbook_xml) and SHEET_REL_PATTERN.search(rels_xml)
+            and SHEET_OVERRIDE_PATTERN.search(content_types_xml)):
+        return None
+
+    sheet_count = len(parts)
+    sheets = "".join(
+        f'<sheet xmlns:r="{NS_REL}" name={quoteattr(sheet_name)} sheetId="{idx}" state="visible" r:id="rIdSheet{idx}"/>'
+        for idx, (sheet_name, _) in enumerate(parts, start=1)
+    )
+    workbook_xml = SHEETS_PATTERN.sub(lambda m: f"<sheets>{sheets}</sheets>", workbook_xml)
+    sheet_rels = "".join(
+        f'<Relationship Id="rIdSheet{idx}" Type="{WORKSHEET_REL_TYPE}" Target="/xl/worksheets/sheet{idx}.xml"/>'
+        for idx in range(1, sheet_count + 1)
+    )
+    rels_xml = SHEET_REL_PATTERN.sub("", rels_xml).replace("</Relationships>", f"{sheet_rels}</Relationships>")
+    sheet_overrides = "".join(
+        f'<Override PartName="/xl/worksheets/sheet{idx}.xml" ContentType="{WORKSHEET_CONTENT_TYPE}"/>'
+        for idx in range(1, sheet_count + 1)
+    )
+    content_types_xml = SHEET_OVERRIDE_PATTERN.sub("", content_types_xml).replace("</Types>", f"{sheet_overrides}</Types>")
+    shared_strings_xml = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<sst xmlns="{NS_MAIN}" uniqueCount="{len(shared_strings)}">{"".join(shared_strings)}</sst>'
+    )
+
+    replaced = {
+        PART_WORKBOOK: workbook_xml,
+        PART_WORKBOOK_RELS: rels_xml,
+        PART_CONTENT_TYPES: content_types_xml,
+        PART_SHARED_STRINGS: shared_strings_xml,
+    }
+    output = BytesIO()
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as merged:
+        for name in base.namelist():
+            if name in replaced or name == PART_SHEET:
+                continue
+            merged.writestr(name, base.read(name))
+        for name, content in replaced.items():
+            merged.writestr(name, content)
+        for idx, sheet_xml in enumerate(sheet_xmls, start=1):
+            merged.writestr(f"xl/worksheets/sheet{idx}.xml", sheet_xml)
+    output.seek(0)
+    return output
+
+
+def _render_parts(pool, section_name, class_sheets, on_progress):
+    # 반별 시트를 작업 프로세스에 나눠 맡기고, 기다리는 동안 진행 상황을 알림
+    sheet_names = [sheet_name for sheet_name, _ in class_sheets]
+    group_dfs = [group_df for _, group_df in class_sheets]
+    futures = _submit_all(pool, render_class_sheet, [section_name] * len(class_sheets), sheet_names, group_dfs)
+    try:
+        pending = set(futures)
+        last_finished = time.monotonic()
+        while pending:
+            finished, pending = wait(pending, timeout=RENDER_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            if finished:
+                last_finished = time.monotonic()
+            elif time.monotonic() - last_finished > RENDER_STALL_TIMEOUT:
+                _discard_render_pool(pool, terminate=True)
+                raise TimeoutError(f"반별 시트 렌더링이 {RENDER_STALL_TIMEOUT}초 동안 진행되지 않았습니다.")
+            if on_progress is not None:
+                on_progress(len(futures) - len(pending), len(futures))
+        return list(zip(sheet_names, [future.result() for future in futures]))
+    finally:
+        # 취소되었거나 실패한 경우 아직 시작하지 않은 시트는 렌더링하지 않음
+        for future in futures:
+            future.cancel()
+
+
+def render_section_workbook(section_name, class_sheets, max_workers=1, on_progress=None):
+    """
+    영역 하나의 반별 시트들을 렌더링해 하나의 통합문서로 만듭니다.
+    반이 여러 개이고 프로세스 풀을 쓸 수 있으면 반마다 따로 렌더링한 뒤 합칩니다.
+    :param section_name: 영역명 (자율활동, 진로활동 등)
+    :param class_sheets: (시트 이름, 반 데이터프레임) 리스트
+    :param max_workers: 프로세스 풀의 작업 프로세스 수 (1이면 순차 렌더링)
+    :param on_progress: (끝난 시트 수, 전체 시트 수)를 받는 함수, 기다리는 동안 주기적으로 호출 (예외를 내면 중단)
+    :return: xlsx BytesIO
+    """
+    pool = get_render_pool(max_workers) if len(class_sheets) >= MIN_PARALLEL_SHEETS else None
+    if pool is not None:
+        try:
+            parts = _render_parts(pool, section_name, class_sheets, on_progress)
+        except BrokenProcessPool:
+            _discard_render_pool(pool)
+        else:
+            output = assemble_workbook(parts)
+            if output is not None:
+                return output
+
+    # 한 통합문서에 차례로 렌더링 (기존 방식)
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        for sheet_idx, (sheet_name, group_df) in enumerate(class_sheets):
+            if on_progress is not None:
+                on_progress(sheet_idx, len(class_sheets))
+            style_class_sheet(writer, section_name, sheet_name, group_df)
+    output.seek(0)
+    return output
@@ -1,15 +1,25 @@
 import streamlit as st
+from streamlit.logger import get_logger
 import pandas as pd
 import unicodedata
 from io import BytesIO
-from openpyxl import load_workbook
-from openpyxl.utils import get_column_letter
-from openpyxl.styles import Font, Alignment, PatternFill
-from openpyxl.formatting.rule import CellIsRule
 import traceback
 import sys
+import zipfile
+import xml.etree.ElementTree as ET
+import sheet_render
 import datetime
 import pytz
+import hashlib
+import importlib
+import os
+import re
+import subprocess
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
 st.set_page_config(
     page_title="엑셀 데이터 통합 및 처리",
@@ -17,6 +27,327 @@ st.set_page_config(
     layout="wide"
 )
 
+# 백그라운드 작업 관련 설정
+# 작업 스레드는 넉넉히 두고, 무거운 단계의 동시 실행 수는 StageScheduler로 제한
+PIPELINE_WORKERS = 8
+MAX_HEAVY_STAGES = max(1, min(4, (os.cpu_count() or 2) // 2))
+JOB_POLL_INTERVAL = 0.5
+PARSE_CACHE_BYTES = 256 * 1024 ** 2
+
+# 사전 점검: xlsx 안의 XML에서 앞쪽 몇 행만 읽어 머리글을 확인
+PREFLIGHT_ROWS = 10
+HEADER_PATTERN = re.compile(r'이름|성명')
+XLSX_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+XLSX_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+
+_job_local = threading.local()
+_rerun = getattr(st, "rerun", None) or st.experimental_rerun
+
+# pandas, pyarrow, pytz는 streamlit을 불러올 때 이미 함께 불러와지므로 맨 위에서 import하고,
+# streamlit이 불러오지 않는 openpyxl, xlsxwriter만 필요한 함수 안에서 불러옵니다.
+# 서버 시작 시 미리 불러오려면 EXCEL_APP_WARMUP=1 (기본값), 끄려면 0
+WARM_UP_ENABLED = os.environ.get("EXCEL_APP_WARMUP", "1") != "0"
+WARM_UP_MODULES = ["openpyxl", "xlsxwriter"]
+STREAMLIT_IMPORT_LABEL = "streamlit (pandas, pyarrow 포함)"
+STREAMLIT_IMPORT_CHECK = "import time; started = time.perf_counter(); import streamlit; print(time.perf_counter() - started)"
+
+DIGITS_PATTERN = re.compile(r'(\d+)')
+FINGERPRINT_STRIP_PATTERN = re.compile(r'[\W_]+')
+
+# 2단계 이후 데이터의 dtype 정책: 번호류는 작은 정수, 반복되는 이름/영역은 category
+ID_COLUMNS = ['학년', '반', '번호']
+CATEGORY_COLUMNS = ['이름', '영역명', '세부영역명', '출처']
+
+# 중복 기재 처리 옵션: 화면에 보이는 이름 -> 제거할 중복 유형
+DUPLICATE_TYPES = ["완전 중복", "유사 중복"]
+DEDUPE_MODES = {
+    "제거하지 않음": set(),
+    "완전 중복만 제거": {"완전 중복"},
+    "유사 중복까지 제거": {"완전 중복", "유사 중복"},
+}
+
+# streamlit의 로거 설정(핸들러, 로그 수준)을 그대로 따름 (logging.getLogger("__main__")는 출력되지 않음)
+logger = get_logger(__name__)
+
+class PipelineCancelled(BaseException):
+    """사용자가 작업을 취소했을 때 발생 (각 단계의 except Exception에 잡히지 않도록 BaseException 사용)"""
+
+class PipelineJob:
+    """백그라운드에서 실행되는 파이프라인 작업의 진행 상황, 에러, 취소 상태"""
+    def __init__(self, key):
+        self.key = key
+        self.future = None
+        self.scheduler = None
+        self.started = False
+        self.admitted = False
+        self.parse_cache = None
+        self.cancel_event = threading.Event()
+        self.errors = []
+        self.error_report = []
+        self.memory_report = []
+        self.stage = "대기 중"
+        self.done = 0
+        self.total = 0
+        self.detail = ""
+        self.collected = False
+
+    def cancel(self):
+        self.cancel_event.set()
+        if self.future is not None and self.future.cancel() and self.scheduler is not None:
+            # 시작도 못 하고 취소된 작업은 대기열에서 바로 뺌
+            self.scheduler.discard(self)
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+class StageScheduler:
+    """
+    모든 세션이 공유하는 무거운 단계 실행 허가 (선착순 대기열)
+    작업은 제출할 때 대기열에 들어가므로, 작업 스레드가 모자라 시작하지 못한 작업도 대기 순번이 보입니다.
+    허가를 받은 작업은 끝날 때까지 자리를 유지하므로, 동시에 데이터를 들고 있는 작업 수도 max_running개로 제한됩니다.
+    """
+    def __init__(self, max_running):
+        self.max_running = max_running
+        self.running = 0
+        self.waiting = deque()
+        self.cond = threading.Condition()
+
+    def enqueue(self, job):
+        with self.cond:
+            self.waiting.append(job)
+
+    def start(self, job):
+        # 작업 스레드에서 실행을 시작한 작업만 단계 실행 허가를 받을 수 있음
+        with self.cond:
+            job.started = True
+            self.cond.notify_all()
+
+    def discard(self, job):
+        with self.cond:
+            if job in self.waiting:
+                self.waiting.remove(job)
+                self.cond.notify_all()
+
+    def _next_runnable(self):
+        # 아직 작업 스레드를 기다리는 작업은 건너뜀 (앞에서 자리만 차지하면 스레드가 모두 멈출 수 있음)
+        return next((waiting_job for waiting_job in self.waiting if waiting_job.started), None)
+
+    def acquire(self, job):
+        with self.cond:
+            if job not in self.waiting:
+                self.waiting.append(job)
+            try:
+                while True:
+                    # 자리가 난 뒤에 깨어나도 그사이 취소된 작업은 허가를 받지 않음
+                    if job.cancelled:
+                        raise PipelineCancelled()
+                    if self._next_runnable() is job and self.running < self.max_running:
+                        break
+                    self.cond.wait(timeout=JOB_POLL_INTERVAL)
+            except BaseException:
+                self.waiting.remove(job)
+                self.cond.notify_all()
+                raise
+            self.waiting.remove(job)
+            self.running += 1
+
+    def release(self):
+        with self.cond:
+            self.running -= 1
+            self.cond.notify_all()
+
+    def position(self, job):
+        # 대기 중이면 1부터 시작하는 대기 순번, 아니면 0
+        with self.cond:
+            for idx, waiting_job in enumerate(self.waiting):
+                if waiting_job is job:
+                    return idx + 1
+        return 0
+
+@st.cache_resource
+def get_stage_scheduler():
+    return StageScheduler(MAX_HEAVY_STAGES)
+
+@contextmanager
+def heavy_stage():
+    # 블록 안의 처리는 전체 프로세스에서 MAX_HEAVY_STAGES개 작업까지만 동시에 실행
+    # 처음 허가를 받은 작업은 다음 단계마다 대기열 뒤로 밀리지 않도록 작업이 끝날 때까지 자리를 유지 (_run_job에서 반납)
+    job = getattr(_job_local, "job", None)
+    if job is not None and not job.admitted:
+        job.scheduler.acquire(job)
+        job.admitted = True
+    yield
+
+def frames_nbytes(frames):
+    # 데이터프레임들의 메모리 사용량 합계(바이트)
+    return int(sum(df.memory_usage(deep=True).sum() for df in frames))
+
+class ParseCache:
+    """
+    업로드 파일 (이름, 내용 해시)별 1단계 파싱 결과와 시트별 2단계 변환 결과 (오류 없이 읽힌 것만 저장)
+    모든 세션이 공유하므로 데이터프레임 크기 합계가 max_bytes를 넘으면 오래 안 쓴 것부터 버립니다.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, nbytes):
+        if nbytes > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= previous[1]
+            self.entries[key] = (value, nbytes)
+            self.total_bytes += nbytes
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_bytes
+
+@st.cache_resource
+def get_parse_cache():
+    return ParseCache(PARSE_CACHE_BYTES)
+
+@st.cache_resource
+def get_worker_pool():
+    # 모든 세션이 공유하는 로컬 워커 풀
+    return ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="pipeline")
+
+def _run_job(job, func, *args):
+    _job_local.job = job
+    job.scheduler.start(job)
+    try:
+        return func(*args)
+    finally:
+        if job.admitted:
+            job.admitted = False
+            job.scheduler.release()
+        job.scheduler.discard(job)
+        _job_local.job = None
+
+def submit_job(key, func, *args):
+    job = PipelineJob(key)
+    job.scheduler = get_stage_scheduler()
+    job.parse_cache = get_parse_cache()
+    job.scheduler.enqueue(job)
+    job.future = get_worker_pool().submit(_run_job, job, func, *args)
+    return job
+
+def report_error(message):
+    # 백그라운드 작업 중이면 작업에 모아두고, 아니면 바로 화면에 표시
+    job = getattr(_job_local, "job", None)
+    if job is not None:
+        job.errors.append(message)
+    else:
+        st.error(message)
+
+def report_issue(stage, file_name, sheet_name, tb_lines):
+    # 일괄 처리 모드: 파일/시트별 오류를 표로 모아두고 계속 진행
+    job = getattr(_job_local, "job", None)
+    issue = {
+        "단계": stage,
+        "파일": file_name,
+        "시트": sheet_name,
+        "오류": tb_lines[-1].strip(),
+        "상세": ''.join(tb_lines),
+    }
+    if job is not None:
+        job.error_report.append(issue)
+    else:
+        st.warning(f"⚠️ {stage} 건너뜀! 파일: {file_name}, 시트: {sheet_name}\n{issue['오류']}")
+
+def report_progress(stage, done, total, detail=""):
+    # 진행 상황을 기록하고, 취소 요청이 있으면 작업을 중단
+    job = getattr(_job_local, "job", None)
+    if job is None:
+        return
+    if job.cancelled:
+        raise PipelineCancelled()
+    job.stage, job.done, job.total, job.detail = stage, done, total, detail
+
+def report_detail(detail):
+    # 현재 단계의 진행 수치는 그대로 두고 세부 내용만 갱신 (취소 요청도 확인)
+    job = getattr(_job_local, "job", None)
+    if job is None:
+        return
+    report_progress(job.stage, job.done, job.total, detail)
+
+def measure_streamlit_import():
+    # streamlit은 이 프로세스에서 이미 불러왔으므로 새 파이썬 프로세스에서 import 시간을 잼
+    completed = subprocess.run(
+        [sys.executable, "-c", STREAMLIT_IMPORT_CHECK], capture_output=True, text=True, timeout=60, check=True
+    )
+    return float(completed.stdout.strip())
+
+def warm_up(timings):
+    # 무거운 라이브러리와 스타일 객체를 미리 만들어 첫 처리 지연을 줄임 (모듈별 import 시간을 timings에 기록)
+    for module_name in WARM_UP_MODULES:
+        if module_name in sys.modules:
+            # 이미 불러온 모듈은 0ms로 보여 시작 비용을 잘못 판단하게 하므로 기록하지 않음
+            continue
+        started = time.perf_counter()
+        try:
+            importlib.import_module(module_name)
+        except ImportError:
+            continue
+        timings[module_name] = time.perf_counter() - started
+    started = time.perf_counter()
+    sheet_render.get_excel_styles()
+    timings["서식 준비"] = time.perf_counter() - started
+    try:
+        timings[STREAMLIT_IMPORT_LABEL] = measure_streamlit_import()
+    except (OSError, subprocess.SubprocessError, ValueError):
+        logger.warning("could not measure the streamlit import time", exc_info=True)
+    logger.info("warm-up import times: %s", ", ".join(f"{name} {sec * 1000:.0f}ms" for name, sec in timings.items()))
+
+@st.cache_resource
+def start_warm_up():
+    # 서버 프로세스당 한 번만 백그라운드에서 실행 (첫 화면은 기다리지 않음)
+    # 측정한 시간은 반환한 딕셔너리에 채워지며 화면 아래쪽에 표시됨
+    timings = {}
+    thread = threading.Thread(target=warm_up, args=(timings,), name="warm-up", daemon=True)
+    thread.start()
+    return timings
+
+def report_memory(stage, frames):
+    # 단계별 데이터프레임 메모리 사용량(MB) 기록
+    job = getattr(_job_local, "job", None)
+    if job is None:
+        return
+    memory_mb = frames_nbytes(frames) / 1024 ** 2
+    job.memory_report.append((stage, memory_mb))
+    logger.info("memory %s: %.1fMB", stage, memory_mb)
+
+def text_string_dtype():
+    # 기재내용은 pyarrow 기반 문자열로 (pyarrow가 없으면 일반 string)
+    try:
+        return pd.StringDtype("pyarrow")
+    except ImportError:
+        return pd.StringDtype()
+
+def apply_dtype_policy(df):
+    df = df.copy()
+    for col in ID_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    if '기재내용' in df.columns:
+        df['기재내용'] = df['기재내용'].astype(text_string_dtype())
+    return df
+
 def normalize_text(value):
     if isinstance(value, str):
         return unicodedata.normalize('NFC', value)
@@ -29,102 +360,199 @@ def extract_fields(sheet_name):
     else:
         return parts[0], ""
 
-def process_uploaded_files(uploaded_files):
+def file_digest(data):
+    # 업로드 파일 내용의 해시 (같은 이름, 같은 크기로 고쳐 올린 파일도 구분)
+    return hashlib.sha1(data).hexdigest()
+
+def process_uploaded_files(uploaded_files, batch_mode=False):
+    job = getattr(_job_local, "job", None)
+    parse_cache = job.parse_cache if job is not None else None
     processed_files_data = {}
+    # 시트 이름 -> (파일 이름, 캐시 키, 이전에 변환해 둔 2단계 결과 또는 None)
+    sheet_sources = {}
     output = BytesIO()
     with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-        for uploaded_file in uploaded_files:
+        for file_idx, uploaded_file in enumerate(uploaded_files):
             file_name = uploaded_file.name
+            report_progress("1단계: 파일 통합", file_idx, len(uploaded_files), file_name)
             try:
-                base_sheet_name = '_'.join(file_name.split('_')[:2])
-                excel_file = pd.ExcelFile(uploaded_file)
-                sheet_dfs = []
-                for sheet_name in excel_file.sheet_names:
-                    try:
-                        df = excel_file.parse(sheet_name=sheet_name, header=None)
-                        name_row_index = df[df.apply(lambda row: row.astype(str).str.contains('이름|성명').any(), axis=1)].index[0]
-                        df.columns = df.iloc[name_row_index].str.replace('성명', '이름')
-                        df = df[name_row_index + 1:]
-                        if '학년' in df.columns:
-                            df['학년'] = df['학년'].astype(str).str.extract('(\d+)').astype(int)
-                        df['영역'] = base_sheet_name
-                        if len(excel_file.sheet_names) == 1:
-                            new_sheet_name = base_sheet_name[:31]
-                        else:
-                            new_sheet_name = f"{base_sheet_name}_{sheet_name}"[:31]
+                # 같은 내용의 파일은 이전에 파싱한 결과를 재사용
+                cache_key = (file_name, file_digest(uploaded_file.getvalue()))
+                sheet_dfs = parse_cache.get(cache_key) if parse_cache is not None else None
+                file_failed = False
+                if sheet_dfs is None:
+                    base_sheet_name = '_'.join(file_name.split('_')[:2])
+                    excel_file = pd.ExcelFile(uploaded_file)
+                    sheet_dfs = []
+                    for sheet_name in excel_file.sheet_names:
+                        try:
+                            df = excel_file.parse(sheet_name=sheet_name, header=None)
+                            name_row_index = df[df.apply(lambda row: row.astype(str).str.contains('이름|성명').any(), axis=1)].index[0]
+                            df.columns = df.iloc[name_row_index].str.replace('성명', '이름')
+                            df = df[name_row_index + 1:]
+                            if '학년' in df.columns:
+                                df['학년'] = df['학년'].astype(str).str.extract(DIGITS_PATTERN).astype(int)
+                            df['영역'] = base_sheet_name
+                            if len(excel_file.sheet_names) == 1:
+                                new_sheet_name = base_sheet_name[:31]
+                            else:
+                                new_sheet_name = f"{base_sheet_name}_{sheet_name}"[:31]
+                            sheet_dfs.append((new_sheet_name, df))
+                        except Exception as e:
+                            exc_type, exc_value, exc_traceback = sys.exc_info()
+                            tb_lines = traceback.format_exception(exc_type, exc_value, exc_traceback)
+                            if batch_mode:
+                                report_issue("1단계", file_name, sheet_name, tb_lines)
+                                file_failed = True
+                                continue
+                            report_error(f"에러 발생! 파일: {file_name}, 시트: {sheet_name}\n{''.join(tb_lines)}")
+                            return None, None, None
+                    if parse_cache is not None and not file_failed:
+                        parse_cache.put(cache_key, sheet_dfs, frames_nbytes([df for _, df in sheet_dfs]))
+                for new_sheet_name, df in sheet_dfs:
+                    # 2단계 결과가 남아 있는 시트는 다시 쓰지 않음 (2단계에서 그대로 재사용)
+                    step2_df = parse_cache.get(cache_key + (new_sheet_name,)) if parse_cache is not None else None
+                    if step2_df is None:
                         df.to_excel(writer, sheet_name=new_sheet_name, index=False)
-                        sheet_dfs.append((new_sheet_name, df))
-                    except Exception as e:
-                        exc_type, exc_value, exc_traceback = sys.exc_info()
-                        tb_lines = traceback.format_exception(exc_type, exc_value, exc_traceback)
-                        st.error(f"에러 발생! 파일: {file_name}, 시트: {sheet_name}\n{''.join(tb_lines)}")
-                        return None, None
-                processed_files_data[file_name] = sheet_dfs
+                    sheet_sources[new_sheet_name] = (file_name, cache_key, step2_df)
+                if sheet_dfs:
+                    processed_files_data[file_name] = sheet_dfs
             except Exception as e:
                 exc_type, exc_value, exc_traceback = sys.exc_info()
                 tb_lines = traceback.format_exception(exc_type, exc_value, exc_traceback)
-                st.error(f"에러 발생! 파일: {file_name}\n{''.join(tb_lines)}")
-                return None, None
+                if batch_mode:
+                    report_issue("1단계", file_name, "", tb_lines)
+                    continue
+                report_error(f"에러 발생! 파일: {file_name}\n{''.join(tb_lines)}")
+                return None, None, None
     output.seek(0)
-    return output, processed_files_data
+    report_memory("1단계: 파일 통합", [df for sheet_dfs in processed_files_data.values() for _, df in sheet_dfs])
+    return output, processed_files_data, sheet_sources
 
-def process_step2_data(step1_data):
+def process_step2_data(step1_data, sheet_sources, batch_mode=False):
+    job = getattr(_job_local, "job", None)
+    parse_cache = job.parse_cache if job is not None else None
+    excel_file = None
     try:
-        with pd.ExcelFile(step1_data) as excel_file:
-            all_data = []
-            for sheet_name in excel_file.sheet_names:
-                try:
-                    df = excel_file.parse(sheet_name=sheet_name)
-                    max_length_col = df.apply(lambda col: col.astype(str).str.len().max(), axis=0).idxmax()
-                    df.columns = df.columns.str.replace(max_length_col, '기재내용', regex=False)
-                    if '학년' in df.columns:
-                        df['학년'] = df['학년'].astype(str).str.extract('(\d+)').astype(int)
-                        df['반'] = df['반'].astype(str).str.extract('(\d+)').astype(int)
-                        df['번호'] = df['번호'].astype(str).str.extract('(\d+)').astype(int)
-                    if '학번' in df.columns:
-                        df['학년'] = df['학번'].astype(str).str[0].astype(int)
-                        df['반'] = df['학번'].astype(str).str[1:3].astype(int)
-                        df['번호'] = df['학번'].astype(str).str[3:].astype(int)
-                    df = df[['학년', '반', '번호', '이름', '영역', '기재내용']]
-                    df['기재내용'] = df['기재내용'].apply(lambda x: x[:x.rfind('.')+1] + ' ' if isinstance(x, str) and '.' in x else x)
-                    all_data.append(df)
-                except Exception as e:
-                    exc_type, exc_value, exc_traceback = sys.exc_info()
-                    tb_lines = traceback.format_exception(exc_type, exc_value, exc_traceback)
-                    st.error(f"에러 발생! 시트: {sheet_name}\n{''.join(tb_lines)}")
-                    return None
-            final_df = pd.concat(all_data, ignore_index=True)
-            for col in ['이름', '기재내용', '영역']:
-                final_df[col] = final_df[col].apply(normalize_text)
-            final_df[['영역명', '세부영역명']] = final_df['영역'].apply(lambda x: pd.Series(extract_fields(x)))
-            for col in ['영역명', '세부영역명']:
-                final_df[col] = final_df[col].apply(normalize_text)
-            final_df = final_df[['학년', '반', '번호', '이름', '영역명', '세부영역명', '기재내용']]
-            return final_df
+        all_data = []
+        for sheet_idx, (sheet_name, (file_name, cache_key, step2_df)) in enumerate(sheet_sources.items()):
+            report_progress("2단계: 데이터 변환", sheet_idx, len(sheet_sources), sheet_name)
+            if step2_df is not None:
+                # 같은 내용의 파일에서 이전에 변환한 시트는 그대로 사용
+                all_data.append(step2_df)
+                continue
+            try:
+                if excel_file is None:
+                    excel_file = pd.ExcelFile(step1_data)
+                df = excel_file.parse(sheet_name=sheet_name)
+                max_length_col = df.apply(lambda col: col.astype(str).str.len().max(), axis=0).idxmax()
+                df.columns = df.columns.str.replace(max_length_col, '기재내용', regex=False)
+                if '학년' in df.columns:
+                    df['학년'] = df['학년'].astype(str).str.extract(DIGITS_PATTERN).astype(int)
+                    df['반'] = df['반'].astype(str).str.extract(DIGITS_PATTERN).astype(int)
+                    df['번호'] = df['번호'].astype(str).str.extract(DIGITS_PATTERN).astype(int)
+                if '학번' in df.columns:
+                    df['학년'] = df['학번'].astype(str).str[0].astype(int)
+                    df['반'] = df['학번'].astype(str).str[1:3].astype(int)
+                    df['번호'] = df['학번'].astype(str).str[3:].astype(int)
+                df = df[['학년', '반', '번호', '이름', '영역', '기재내용']]
+                df['출처'] = sheet_name
+                df['기재내용'] = df['기재내용'].apply(lambda x: x[:x.rfind('.')+1] + ' ' if isinstance(x, str) and '.' in x else x)
+                all_data.append(df)
+                if parse_cache is not None:
+                    parse_cache.put(cache_key + (sheet_name,), df, frames_nbytes([df]))
+            except Exception as e:
+                exc_type, exc_value, exc_traceback = sys.exc_info()
+                tb_lines = traceback.format_exception(exc_type, exc_value, exc_traceback)
+                if batch_mode:
+                    report_issue("2단계", file_name, sheet_name, tb_lines)
+                    continue
+                report_error(f"에러 발생! 파일: {file_name}, 시트: {sheet_name}\n{''.join(tb_lines)}")
+                return None
+        if not all_data:
+            report_error("2단계: 처리할 수 있는 시트가 없습니다.")
+            return None
+        final_df = pd.concat(all_data, ignore_index=True)
+        for col in ['이름', '기재내용', '영역']:
+            final_df[col] = final_df[col].apply(normalize_text)
+        final_df[['영역명', '세부영역명']] = final_df['영역'].apply(lambda x: pd.Series(extract_fields(x)))
+        for col in ['영역명', '세부영역명']:
+            final_df[col] = final_df[col].apply(normalize_text)
+        final_df = final_df[['학년', '반', '번호', '이름', '영역명', '세부영역명', '기재내용', '출처']]
+        report_memory("2단계: 데이터 변환 (dtype 적용 전)", [final_df])
+        final_df = apply_dtype_policy(final_df)
+        report_memory("2단계: 데이터 변환 (dtype 적용 후)", [final_df])
+        return final_df
     except Exception as e:
         exc_type, exc_value, exc_traceback = sys.exc_info()
         tb_lines = traceback.format_exception(exc_type, exc_value, exc_traceback)
-        st.error(f"2단계 처리 중 에러 발생!\n{''.join(tb_lines)}")
+        report_error(f"2단계 처리 중 에러 발생!\n{''.join(tb_lines)}")
         return None
-
-def create_pivot_tables(final_df):
+    finally:
+        if excel_file is not None:
+            excel_file.close()
+
+def text_fingerprint(text):
+    # 띄어쓰기, 문장부호, 대소문자 차이를 무시한 기재내용 지문 (정규화한 문자열 그대로 색인 키로 사용)
+    return FINGERPRINT_STRIP_PATTERN.sub('', unicodedata.normalize('NFC', text).lower())
+
+def find_duplicate_entries(final_df):
+    # (학생, 영역명, 기재내용 지문)으로 해시 색인을 만들어 한 번 훑으며 중복 기재를 찾음
+    key_columns = ['학년', '반', '번호', '이름', '영역명']
+    report_columns = key_columns + ['세부영역명', '출처', '먼저 나온 출처', '중복유형', '기재내용', '행']
+    df = final_df[final_df['기재내용'].map(lambda x: isinstance(x, str) and x.strip() != "")]
+    sources = df['출처'] if '출처' in df.columns else df['세부영역명']
+
+    seen = {}
+    records = []
+    for row_idx, student_key, sub_section, text, source in zip(
+        df.index, df[key_columns].itertuples(index=False, name=None), df['세부영역명'], df['기재내용'], sources
+    ):
+        text = text.strip()
+        index_key = (student_key, text_fingerprint(text))
+        if index_key not in seen:
+            seen[index_key] = (text, source)
+            continue
+        first_text, first_source = seen[index_key]
+        records.append(list(student_key) + [
+            sub_section,
+            source,
+            first_source,
+            "완전 중복" if text == first_text else "유사 중복",
+            text,
+            row_idx,
+        ])
+    return pd.DataFrame(records, columns=report_columns)
+
+def drop_duplicate_entries(final_df, duplicate_report, dedupe_mode):
+    # 선택한 유형의 중복 기재를 피벗 전에 제거 (처음 나온 기재는 남김)
+    drop_types = DEDUPE_MODES.get(dedupe_mode, set())
+    if not drop_types or duplicate_report.empty:
+        return final_df
+    drop_rows = duplicate_report.loc[duplicate_report['중복유형'].isin(drop_types), '행']
+    return final_df.drop(index=drop_rows)
+
+def create_pivot_tables(final_df, roster_df=None):
     try:
         section_df_list = []
-        for section_name in final_df['영역명'].unique():
+        section_names = final_df['영역명'].unique()
+        for section_idx, section_name in enumerate(section_names):
+            report_progress("3단계: 피벗 테이블 생성", section_idx, len(section_names), section_name)
             section_df = final_df[final_df['영역명'] == section_name]
             
             # 특기사항을 그룹화 및 피벗화
-            section_df = section_df.groupby(['학년', '반', '번호', '이름', '세부영역명'], as_index=False).agg({
+            # category 열은 실제로 있는 조합만 묶고(observed=True), 피벗 열 이름은 일반 문자열로
+            section_df = section_df.groupby(['학년', '반', '번호', '이름', '세부영역명'], as_index=False, observed=True).agg({
                 '기재내용': lambda x: ' | '.join(x.dropna().astype(str))
             })
+            section_df = section_df.astype({'이름': str, '세부영역명': str})
             section_df_pivot = section_df.pivot(index=['학년', '반', '번호', '이름'], columns='세부영역명', values='기재내용')
             section_df_pivot.reset_index(inplace=True)
 
             # 명렬표와 병합하여 누락된 학생 추가
-            if 'roster_df' in st.session_state and st.session_state.roster_df is not None:
-                roster_df = st.session_state.roster_df.copy()
+            if roster_df is not None:
                 section_df_pivot = pd.merge(
-                    roster_df,
+                    roster_df.copy(),
                     section_df_pivot,
                     on=['학년', '반', '번호', '이름'],
                     how='left'
@@ -136,151 +564,29 @@ def create_pivot_tables(final_df):
             # 결과 추가
             section_df_list.append((section_name, section_df_pivot))
 
+        report_memory("3단계: 피벗 테이블 생성", [df for _, df in section_df_list])
         return section_df_list
     except Exception as e:
         exc_type, exc_value, exc_traceback = sys.exc_info()
         tb_lines = traceback.format_exception(exc_type, exc_value, exc_traceback)
-        st.error(f"3단계 피벗 테이블 생성 중 에러 발생!\n{''.join(tb_lines)}")
+        report_error(f"3단계 피벗 테이블 생성 중 에러 발생!\n{''.join(tb_lines)}")
         return []
-    
-from openpyxl.styles import Border, Side
 
 def add_excel_formulas(section_name, df):
     try:
-        output_step4 = BytesIO()
-        with pd.ExcelWriter(output_step4, engine="openpyxl") as writer:
-            grouped = df.groupby(['학년', '반'])
-            for (grade, class_num), group_df in grouped:
-                sheet_name = f"{grade}학년_{class_num}반"[:31]
-                group_df = group_df.applymap(lambda x: "" if str(x).strip() == "X" else x)
-                group_df.to_excel(writer, index=False, sheet_name=sheet_name)
-
-                wb = writer.book
-                ws = wb[sheet_name]
-
-                # 열 고정 및 시작 컬럼 설정
-                ws.freeze_panes = "E2"
-                start_col = 5
-                num_cols = len(group_df.columns) - start_col + 1
-                additional_col = start_col + num_cols
-                combine_col_index = additional_col + 1
-                byte_col_index = combine_col_index + 1
-
-                # 특기사항 합본 및 바이트 계산 수식 추가
-                # '이름' 열에서 마지막 유효 행 찾기
-                name_col_letter = get_column_letter(group_df.columns.get_loc("이름") + 1)  # '이름' 열의 열 문자
-                last_name_row = max(
-                    row.row for row in ws[name_col_letter] if row.value  # '이름' 열의 유효 값이 있는 행을 찾음
-                )
-
-                # 특기사항 합본 및 바이트 계산 수식 추가 (마지막 유효 행까지만 적용)
-                for idx in range(2, last_name_row + 1):  # 범위를 '이름' 열의 마지막 유효 행으로 제한
-                    concat_formula = "=" + "CONCATENATE(" + ",".join(
-                        [f"{get_column_letter(start_col + num_cols)}{idx}"] +  # 마지막 열 먼저 추가
-                        [f"{get_column_letter(col)}{idx}" for col in range(start_col, start_col + num_cols)]  # 나머지 열 추가
-                    ) + ")"
-                    ws[f"{get_column_letter(combine_col_index)}{idx}"] = concat_formula
-                    ws[f"{get_column_letter(byte_col_index)}{idx}"] = (
-                        f'=LENB({get_column_letter(combine_col_index)}{idx})*2-LEN({get_column_letter(combine_col_index)}{idx})'
-                    )
-
-                if section_name == "자율활동":
-                    ws[f"{get_column_letter(additional_col)}1"] = "비고(학급임원파일과 학급활동 등은 수기로 추가해주세요. 마지막 온점 뒤 띄어쓰기 필수!)"
-                elif section_name == "진로활동":
-                    ws[f"{get_column_letter(additional_col)}1"] = "비고(수기로 추가할 내용을 작성해주세요. 마지막 온점 뒤 띄어쓰기 필수!)"
-
-                # 열 이름 설정
-                # ws[f"{get_column_letter(additional_col)}1"] = "비고(학급임원파일과 학급활동 등은 수기로 추가해주세요. 마지막 온점 뒤 띄어쓰기 필수!)"
-                ws[f"{get_column_letter(combine_col_index)}1"] = "특기사항 합본"
-                ws[f"{get_column_letter(byte_col_index)}1"] = "바이트 계산"
-
-                # 셀 스타일 및 포맷 적용
-                yellow_fill = PatternFill(start_color="FFFF99", end_color="FFFF99", fill_type="solid")
-                red_fill = PatternFill(start_color="FF0000", end_color="FF0000", fill_type="solid")
-                bold_font = Font(size=14, bold=True)
-                large_bold_font = Font(size=20, bold=True)  # 20포인트 굵은 글씨 추가
-                center_alignment = Alignment(horizontal="center", vertical="center")
-
-                # 마지막 세 열(비고, 특기사항 합본, 바이트 계산) 헤더에 노란색 배경과 굵은 글씨 적용
-                remarks_col_letter = get_column_letter(additional_col)
-                combine_col_letter = get_column_letter(combine_col_index)
-                byte_col_letter = get_column_letter(byte_col_index)
-
-                for col_letter in [remarks_col_letter, combine_col_letter, byte_col_letter]:
-                    ws[f"{col_letter}1"].fill = yellow_fill
-                    ws[f"{col_letter}1"].font = bold_font
-                    ws[f"{col_letter}1"].alignment = Alignment(wrap_text=True)  # 텍스트 래핑 적용
-
-
-                # 바이트 계산 열 서식 (모든 행에 대해 적용)
-                # 모든 행에 대해 가운데 정렬, 굵게, 글씨 크기 20포인트 적용
-                for row_idx in range(2, ws.max_row + 1):
-                    cell = ws[f"{byte_col_letter}{row_idx}"]
-                    cell.alignment = center_alignment
-                    cell.font = large_bold_font  # 20포인트 굵은 글씨
-                    # 조건부 서식은 별도로 적용
-
-
-                for col_letter in [remarks_col_letter, combine_col_letter, byte_col_letter]:
-                    ws[f"{col_letter}1"].fill = yellow_fill
-                    ws[f"{col_letter}1"].font = bold_font
-                    ws[f"{col_letter}1"].alignment = Alignment(wrap_text=True)  # 텍스트 래핑 적용
-
-                if section_name == "자율활동":
-                    # 자율활동: 바이트 계산이 1500 초과 시 빨간색 조건부 서식 적용
-                    ws.conditional_formatting.add(
-                        f"{byte_col_letter}2:{byte_col_letter}{ws.max_row}",
-                        CellIsRule(operator="greaterThan", formula=["1500"], stopIfTrue=True, fill=red_fill)
-                    )
-                elif section_name == "진로활동":
-                    # 진로활동: 바이트 계산이 2100 초과 시 빨간색 조건부 서식 적용
-                    ws.conditional_formatting.add(
-                        f"{byte_col_letter}2:{byte_col_letter}{ws.max_row}",
-                        CellIsRule(operator="greaterThan", formula=["2100"], stopIfTrue=True, fill=red_fill)
-                    )
-
-                # 테두리 스타일 정의
-                thin_border = Border(
-                    left=Side(style='thin'),
-                    right=Side(style='thin'),
-                    top=Side(style='thin'),
-                    bottom=Side(style='thin')
-                )
-                # 셀 높이를 2행부터 최대값으로 고정
-                # 행 높이 설정
-                # 행 높이 강제 설정
-                for row_idx in range(2, ws.max_row + 1):
-                    ws.row_dimensions[row_idx].height = 300  # 최대값
-
-                # 열 너비 및 텍스트 정렬 설정
-                for col_idx in range(start_col, byte_col_index + 1):
-                    col_letter = get_column_letter(col_idx)
-                    if col_idx == combine_col_index:
-                        ws.column_dimensions[col_letter].width = 150
-                    elif col_idx == byte_col_index:
-                        ws.column_dimensions[col_letter].width = 20
-                    else:
-                        ws.column_dimensions[col_letter].width = 50
-
-                    # 셀 텍스트 줄바꿈 및 상단 정렬 + 테두리 적용
-                    for row_idx in range(2, ws.max_row + 1):
-                        cell = ws[f"{col_letter}{row_idx}"]
-                        if cell.value:  # 값이 있는 셀에만 테두리 적용
-                            cell.alignment = Alignment(wrap_text=True, vertical="center")  # 텍스트 줄바꿈
-                            cell.border = thin_border
-
-                # # 행 높이 자동 조절: 바이트 수에 따라 선형적으로 증가
-                # # 변환 공식: y 포인트 ≈ 0.0805 * 바이트 + 65.15
-                # for row_idx in range(2, ws.max_row + 1):
-                #     byte_value = ws[f"{byte_col_letter}{row_idx}"].value
-                #     if byte_value is not None and isinstance(byte_value, (int, float)):
-                #         # 선형 변환 공식 적용
-                #         row_height = 0.2*byte_value + 100
-                #         # 행 높이를 포인트 단위로 설정 (엑셀의 단위)
-                #         ws.row_dimensions[row_idx].height = row_height
-                #     else:
-                #         # 기본 행 높이 설정
-                #         ws.row_dimensions[row_idx].height = 15
+        # 반별 시트는 작업 프로세스에서 따로 렌더링한 뒤 하나의 통합문서로 합침 (sheet_render 참고)
+        class_sheets = []
+        for (grade, class_num), group_df in df.groupby(['학년', '반']):
+            sheet_name = f"{grade}학년_{class_num}반"[:31]
+            group_df = group_df.applymap(lambda x: "" if str(x).strip() == "X" else x)
+            class_sheets.append((sheet_name, group_df))
+        # 작업 프로세스 수는 무거운 단계 동시 실행 수에 맞춤 (CPU 사용량을 스케줄러 한도 안으로)
+        output_step4 = sheet_render.render_section_workbook(
+            section_name,
+            class_sheets,
+            max_workers=MAX_HEAVY_STAGES,
+            on_progress=lambda done, total: report_detail(f"{section_name} (반별 시트 {done}/{total})"),
+        )
 
         output_step4.seek(0)
         preview_data = pd.DataFrame(df.values)
@@ -289,10 +595,382 @@ def add_excel_formulas(section_name, df):
     except Exception as e:
         exc_type, exc_value, exc_traceback = sys.exc_info()
         tb_lines = traceback.format_exception(exc_type, exc_value, exc_traceback)
-        st.error(f"4단계 수식 추가 처리 중 에러 발생! 영역명: {section_name}\n{''.join(tb_lines)}")
+        report_error(f"4단계 수식 추가 처리 중 에러 발생! 영역명: {section_name}\n{''.join(tb_lines)}")
         return None, None
 
+def _scan_sheet_xml(archive, path, max_rows):
+    # 시트 XML을 처음부터 훑어 범위(dimension)와 앞쪽 max_rows행의 셀 값만 읽음
+    dimension = None
+    rows = []
+    with archive.open(path) as sheet_file:
+        for _, elem in ET.iterparse(sheet_file, events=("end",)):
+            if elem.tag == f"{XLSX_NS}dimension":
+                dimension = elem.get("ref")
+            elif elem.tag == f"{XLSX_NS}row":
+                cells = []
+                for cell in elem.iter(f"{XLSX_NS}c"):
+                    cell_type = cell.get("t")
+                    if cell_type == "inlineStr":
+                        cells.append("".join(t.text or "" for t in cell.iter(f"{XLSX_NS}t")))
+                        continue
+                    value = cell.find(f"{XLSX_NS}v")
+                    if value is None or value.text is None:
+                        cells.append("")
+                    elif cell_type == "s":
+                        cells.append(int(value.text))  # 공유 문자열 번호 (나중에 문자열로 바꿈)
+                    else:
+                        cells.append(value.text)
+                rows.append(cells)
+                elem.clear()
+                if len(rows) >= max_rows:
+                    break
+    return dimension, rows
+
+def _read_shared_strings(archive, count):
+    # 공유 문자열을 앞에서부터 count개만 읽음
+    strings = []
+    if count <= 0 or "xl/sharedStrings.xml" not in archive.namelist():
+        return strings
+    with archive.open("xl/sharedStrings.xml") as strings_file:
+        for _, elem in ET.iterparse(strings_file, events=("end",)):
+            if elem.tag == f"{XLSX_NS}si":
+                strings.append("".join(t.text or "" for t in elem.iter(f"{XLSX_NS}t")))
+                elem.clear()
+                if len(strings) >= count:
+                    break
+    return strings
+
+def scan_xlsx_metadata(data, max_rows=PREFLIGHT_ROWS):
+    # 전체를 파싱하지 않고 시트 이름, 범위, 앞쪽 몇 행만 읽음
+    with zipfile.ZipFile(BytesIO(data)) as archive:
+        workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+        rels = ET.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+        targets = {rel.get("Id"): rel.get("Target") for rel in rels}
+
+        sheets = []
+        for sheet in workbook.iter(f"{XLSX_NS}sheet"):
+            target = targets[sheet.get(f"{XLSX_REL_NS}id")]
+            path = target.lstrip("/") if target.startswith("/") else f"xl/{target}"
+            dimension, rows = _scan_sheet_xml(archive, path, max_rows)
+            sheets.append({"name": sheet.get("name"), "dimension": dimension, "rows": rows})
+
+        string_indexes = [cell for sheet in sheets for row in sheet["rows"] for cell in row if isinstance(cell, int)]
+        shared_strings = _read_shared_strings(archive, max(string_indexes, default=-1) + 1)
+        for sheet in sheets:
+            sheet["rows"] = [
+                [shared_strings[cell] if isinstance(cell, int) and cell < len(shared_strings) else cell for cell in row]
+                for row in sheet["rows"]
+            ]
+    return sheets
+
+@st.cache_data(max_entries=512, show_spinner=False)
+def preflight_file(file_name, data):
+    # 파일 하나의 사전 점검 (파일명 규칙, 시트 수, 이름/성명 머리글)
+    issues = []
+    sheet_info = []
+
+    def add_issue(level, sheet_name, message):
+        issues.append({"파일": file_name, "시트": sheet_name, "수준": level, "내용": message})
+
+    underscore_count = file_name.count('_')
+    if underscore_count < 2:
+        add_issue("오류", "", "파일명이 '영역명_세부파일명_기존파일명.xlsx' 형식이 아닙니다. ('_'가 두 번 필요)")
+    elif underscore_count > 2:
+        add_issue("주의", "", f"파일명에 '_'가 {underscore_count}번 있습니다. 앞의 두 부분만 영역명/세부파일명으로 사용됩니다.")
+
+    if not file_name.lower().endswith(".xlsx"):
+        add_issue("주의", "", "xls 파일은 사전 점검을 건너뜁니다.")
+        return issues, sheet_info
+    try:
+        sheets = scan_xlsx_metadata(data)
+    except (zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+        add_issue("오류", "", f"엑셀(xlsx) 파일 구조를 읽을 수 없습니다: {e}")
+        return issues, sheet_info
+
+    if len(sheets) > 1:
+        add_issue("주의", "", f"시트가 {len(sheets)}개입니다. 시트마다 따로 처리됩니다.")
+    for sheet in sheets:
+        header_row = next(
+            (idx + 1 for idx, row in enumerate(sheet["rows"]) if any(HEADER_PATTERN.search(str(cell)) for cell in row)),
+            None
+        )
+        if header_row is None:
+            # 실제 처리에서는 시트 전체에서 머리글을 찾으므로 처리를 막지는 않음 (제목 부분이 긴 파일)
+            add_issue("주의", sheet["name"], f"앞쪽 {PREFLIGHT_ROWS}행에서 '이름' 또는 '성명' 머리글을 찾지 못했습니다. 처리할 때 시트 전체에서 다시 찾습니다.")
+        sheet_info.append({
+            "파일": file_name,
+            "시트": sheet["name"],
+            "범위": sheet["dimension"] or "",
+            "머리글 행": header_row or "",
+        })
+    return issues, sheet_info
+
+def preflight_check(uploaded_files):
+    # 업로드된 파일 전체를 파싱 전에 점검하고, 파일 사이의 충돌(같은 영역명_세부파일명)도 확인
+    issues = []
+    sheet_info = []
+    seen_bases = {}
+    for uploaded_file in uploaded_files:
+        file_issues, file_sheet_info = preflight_file(uploaded_file.name, uploaded_file.getvalue())
+        issues.extend(file_issues)
+        sheet_info.extend(file_sheet_info)
+
+        base_sheet_name = '_'.join(uploaded_file.name.split('_')[:2])
+        if base_sheet_name in seen_bases:
+            issues.append({
+                "파일": uploaded_file.name,
+                "시트": "",
+                "수준": "오류",
+                "내용": f"'{base_sheet_name}'(으)로 시작하는 파일이 이미 있습니다: {seen_bases[base_sheet_name]}",
+            })
+        else:
+            seen_bases[base_sheet_name] = uploaded_file.name
+    return issues, sheet_info
+
+@st.cache_resource(max_entries=16)
+def load_roster(roster_bytes):
+    # 같은 명렬표는 모든 세션이 한 번 읽은 결과를 공유 (읽기 전용으로 사용)
+    raw_df = pd.read_excel(BytesIO(roster_bytes))
+    roster_df = raw_df.copy()
+
+    # 열 이름 '성명'을 '이름'으로 수정
+    renamed = '성명' in roster_df.columns
+    if renamed:
+        roster_df.rename(columns={'성명': '이름'}, inplace=True)
+
+    # 학번이 있는 경우 학년, 반, 번호로 분리
+    split = '학번' in roster_df.columns
+    if split:
+        if '학년' in roster_df.columns:
+
+            roster_df = roster_df.drop(columns=['학년'])
+        roster_df['학년'] = roster_df['학번'].astype(str).str[0].astype(int)
+        roster_df['반'] = roster_df['학번'].astype(str).str[1:3].astype(int)
+        roster_df['번호'] = roster_df['학번'].astype(str).str[3:].astype(int)
+
+    # 열 순서 정렬
+    required_columns = ['학년', '반', '번호', '이름']
+    if set(required_columns).issubset(roster_df.columns):
+        roster_df = roster_df[required_columns]
+    return raw_df, roster_df, renamed, split
+
+# 체크포인트 zip 안의 파일 이름
+CHECKPOINT_ROSTER = "명렬표.parquet"
+CHECKPOINT_STEP2 = "2단계.parquet"
+CHECKPOINT_STEP3_DIR = "3단계/"
+
+def _to_parquet_bytes(df):
+    # 숫자와 문자열이 섞인 object 열은 parquet에 저장할 수 없어 문자열로 통일
+    df = df.copy()
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].map(lambda x: x if x is None or isinstance(x, str) or pd.isna(x) else str(x))
+    buffer = BytesIO()
+    df.to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+def save_checkpoint(step2_df=None, section_df_list=None, roster_df=None):
+    # 단계별 결과를 parquet 파일로 묶은 zip 체크포인트 생성
+    output = BytesIO()
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_STORED) as archive:
+        if roster_df is not None:
+            archive.writestr(CHECKPOINT_ROSTER, _to_parquet_bytes(roster_df))
+        if step2_df is not None:
+            archive.writestr(CHECKPOINT_STEP2, _to_parquet_bytes(step2_df))
+        for section_name, df in section_df_list or []:
+            archive.writestr(f"{CHECKPOINT_STEP3_DIR}{section_name}.parquet", _to_parquet_bytes(df))
+    output.seek(0)
+    return output
+
+@st.cache_resource(max_entries=16)
+def load_roster_checkpoint(roster_bytes):
+    # 명렬표 체크포인트는 명렬표마다 한 번만 만듦 (작업 진행 중에도 화면이 자주 다시 그려짐)
+    _, roster_df, _, _ = load_roster(roster_bytes)
+    return save_checkpoint(roster_df=roster_df).getvalue()
+
+def load_checkpoint(data):
+    # 체크포인트 zip을 읽어 (2단계 데이터, 3단계 영역별 데이터, 명렬표) 반환
+    step2_df, section_df_list, roster_df = None, [], None
+    with zipfile.ZipFile(BytesIO(data)) as archive:
+        for member in archive.namelist():
+            if member == CHECKPOINT_ROSTER:
+                roster_df = pd.read_parquet(BytesIO(archive.read(member)))
+            elif member == CHECKPOINT_STEP2:
+                step2_df = pd.read_parquet(BytesIO(archive.read(member)))
+            elif member.startswith(CHECKPOINT_STEP3_DIR) and member.endswith(".parquet"):
+                section_name = member[len(CHECKPOINT_STEP3_DIR):-len(".parquet")]
+                section_df_list.append((section_name, pd.read_parquet(BytesIO(archive.read(member)))))
+    return step2_df, section_df_list, roster_df
+
+def empty_pipeline_result():
+    return {
+        "step1_data": None,
+        "processed_files_data": None,
+        "step2_data": None,
+        "step2_outputs": None,
+        "step2_checkpoint": None,
+        "duplicate_report": None,
+        "step3_data": [],
+        "step3_outputs": {},
+        "step3_checkpoint": None,
+        "step4_outputs": [],
+    }
+
+def _continue_from_step2(result, final_df, roster_df, dedupe_mode=None):
+    # 2단계 결과부터 3, 4단계까지 이어서 실행
+    result["step2_data"] = final_df
+
+    # 2단계 다운로드 파일 미리 만들기
+    with heavy_stage():
+        report_progress("2단계: 다운로드 파일 생성", 0, 1)
+        # '출처'는 중복 기재 확인용 내부 열이므로 다운로드 파일에서는 뺌
+        export_df = final_df.drop(columns=['출처'], errors='ignore')
+        output_step2 = BytesIO()
+        export_df.to_excel(output_step2, index=False, engine='xlsxwriter')
+        output_step2.seek(0)
+        output_single_sheet = BytesIO()
+        export_df.to_excel(output_single_sheet, index=False, sheet_name="모든 데이터")
+        output_single_sheet.seek(0)
+        result["step2_outputs"] = (output_step2, output_single_sheet)
+        result["step2_checkpoint"] = save_checkpoint(step2_df=final_df, roster_df=roster_df)
+
+    with heavy_stage():
+        report_progress("3단계: 중복 기재 확인", 0, 1)
+        duplicate_report = find_duplicate_entries(final_df)
+        result["duplicate_report"] = duplicate_report
+        final_df = drop_duplicate_entries(final_df, duplicate_report, dedupe_mode)
+        section_df_list = create_pivot_tables(final_df, roster_df)
+    _continue_from_step3(result, section_df_list, roster_df)
+
+def _continue_from_step3(result, section_df_list, roster_df):
+    # 3단계 결과부터 4단계까지 이어서 실행
+    result["step3_data"] = section_df_list
+    with heavy_stage():
+        for section_idx, (section_name, df) in enumerate(section_df_list):
+            report_progress("3단계: 다운로드 파일 생성", section_idx, len(section_df_list), section_name)
+            output_step3 = BytesIO()
+            with pd.ExcelWriter(output_step3, engine="xlsxwriter") as writer:
+                df.to_excel(writer, index=False, sheet_name="특기사항")
+            output_step3.seek(0)
+            result["step3_outputs"][section_name] = output_step3
+        if section_df_list:
+            result["step3_checkpoint"] = save_checkpoint(section_df_list=section_df_list, roster_df=roster_df)
+
+    if roster_df is not None:
+        for section_idx, (section_name, df) in enumerate(section_df_list):
+            report_progress("4단계: 최종본 생성", section_idx, len(section_df_list), section_name)
+            with heavy_stage():
+                temp_output, preview_data = add_excel_formulas(section_name, df)
+            if temp_output and preview_data is not None:
+                result["step4_outputs"].append((section_name, temp_output, preview_data))
+        report_memory("4단계: 최종본 생성", [preview_data for _, _, preview_data in result["step4_outputs"]])
+
+    report_progress("완료", 1, 1)
+
+def run_pipeline(uploaded_files, roster_df, dedupe_mode=None, batch_mode=False):
+    # 1~4단계를 한 번에 실행 (백그라운드 작업으로 제출됨)
+    result = empty_pipeline_result()
+
+    with heavy_stage():
+        output, processed_files_data, sheet_sources = process_uploaded_files(uploaded_files, batch_mode)
+    if not (output and processed_files_data):
+        return result
+    result["step1_data"] = output
+    result["processed_files_data"] = processed_files_data
+
+    with heavy_stage():
+        final_df = process_step2_data(output, sheet_sources, batch_mode)
+    if final_df is None:
+        return result
+    _continue_from_step2(result, final_df, roster_df, dedupe_mode)
+    return result
+
+def resume_pipeline(checkpoint_data_list, roster_df, dedupe_mode=None):
+    # 체크포인트(여러 개면 합쳐서)를 불러와 다음 단계부터 이어서 실행
+    result = empty_pipeline_result()
+    step2_df, section_df_list, checkpoint_roster_df = None, [], None
+    try:
+        for checkpoint_data in checkpoint_data_list:
+            loaded_step2_df, loaded_section_df_list, loaded_roster_df = load_checkpoint(checkpoint_data)
+            if loaded_step2_df is not None:
+                step2_df = loaded_step2_df
+            if loaded_section_df_list:
+                section_df_list = loaded_section_df_list
+            if loaded_roster_df is not None:
+                checkpoint_roster_df = loaded_roster_df
+    except Exception as e:
+        exc_type, exc_value, exc_traceback = sys.exc_info()
+        tb_lines = traceback.format_exception(exc_type, exc_value, exc_traceback)
+        report_error(f"체크포인트 불러오기 중 에러 발생!\n{''.join(tb_lines)}")
+        return result
+    if roster_df is None:
+        roster_df = checkpoint_roster_df
 
+    if section_df_list:
+        _continue_from_step3(result, section_df_list, roster_df)
+    elif step2_df is not None:
+        _continue_from_step2(result, step2_df, roster_df, dedupe_mode)
+    else:
+        report_error("체크포인트에 2단계 또는 3단계 결과가 없습니다.")
+    return result
+
+def reset_pipeline_state():
+    # 이전 작업의 결과(다운로드 파일 포함)가 남아 보이지 않도록 세션 정리
+    for key, value in empty_pipeline_result().items():
+        st.session_state[key] = value
+    st.session_state.step4_data = []
+    st.session_state.memory_report = []
+    st.session_state.error_report = []
+
+def show_pipeline_job(job_key, func, *args):
+    # 같은 입력의 작업이 없으면 제출하고, 진행 상황/취소/결과 반영을 처리
+    job = st.session_state.pipeline_job
+    if job is None or job.key != job_key:
+        if job is not None:
+            job.cancel()
+        reset_pipeline_state()
+        job = submit_job(job_key, func, *args)
+        st.session_state.pipeline_job = job
+
+    if job.cancelled:
+        st.warning("⏹ 처리 작업이 취소되었습니다.")
+        if st.button("🔄 다시 처리하기"):
+            reset_pipeline_state()
+            st.session_state.pipeline_job = submit_job(job_key, func, *args)
+            _rerun()
+    elif not job.future.done():
+        # 진행 상황 표시 후 잠시 뒤 다시 확인
+        progress = job.done / job.total if job.total else 0.0
+        queue_position = job.scheduler.position(job)
+        if queue_position:
+            st.progress(progress, text=f"🕒 다른 사용자의 작업이 끝나길 기다리는 중... (대기 순번 {queue_position}번)")
+        else:
+            st.progress(progress, text=f"⏳ {job.stage} ({job.done}/{job.total}) {job.detail}")
+        if st.button("⏹ 작업 취소"):
+            job.cancel()
+        time.sleep(JOB_POLL_INTERVAL)
+        _rerun()
+    elif not job.collected:
+        # 완료된 결과를 세션에 반영
+        try:
+            result = job.future.result()
+        except Exception as e:
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            tb_lines = traceback.format_exception(exc_type, exc_value, exc_traceback)
+            job.errors.append(f"처리 작업 중 에러 발생!\n{''.join(tb_lines)}")
+            result = empty_pipeline_result()
+        for key, value in result.items():
+            st.session_state[key] = value
+        st.session_state.step4_data = [(name, preview) for name, _, preview in st.session_state.step4_outputs]
+        st.session_state.memory_report = job.memory_report
+        st.session_state.error_report = job.error_report
+        job.collected = True
+
+    for message in job.errors:
+        st.error(message)
+    return job
+
+
+warm_up_timings = start_warm_up() if WARM_UP_ENABLED else {}
 
 st.title("📑 엑셀 데이터 처리 앱")
 
@@ -333,6 +1011,26 @@ if "uploader_key" not in st.session_state:
     st.session_state.uploader_key = 0
 if 'roster_df' not in st.session_state:
     st.session_state.roster_df = None
+if 'processed_files_data' not in st.session_state:
+    st.session_state.processed_files_data = None
+if 'step2_outputs' not in st.session_state:
+    st.session_state.step2_outputs = None
+if 'step3_outputs' not in st.session_state:
+    st.session_state.step3_outputs = {}
+if 'step2_checkpoint' not in st.session_state:
+    st.session_state.step2_checkpoint = None
+if 'step3_checkpoint' not in st.session_state:
+    st.session_state.step3_checkpoint = None
+if 'duplicate_report' not in st.session_state:
+    st.session_state.duplicate_report = None
+if 'error_report' not in st.session_state:
+    st.session_state.error_report = []
+if 'memory_report' not in st.session_state:
+    st.session_state.memory_report = []
+if 'step4_outputs' not in st.session_state:
+    st.session_state.step4_outputs = []
+if 'pipeline_job' not in st.session_state:
+    st.session_state.pipeline_job = None
 
 st.subheader("1️⃣ 학생 명렬표 업로드")
 col_1_1, col_1_2 = st.columns(2)
@@ -340,28 +1038,19 @@ with col_1_1:
     roster_file = st.file_uploader("학생 명렬표 업로드 (학년, 반, 번호, 이름 포함)", type=["xls", "xlsx"], key="roster")
 if roster_file is not None:
     try:
-        roster_df = pd.read_excel(roster_file)
+        raw_df, roster_df, renamed, split = load_roster(roster_file.getvalue())
         # 성공 메시지: 총 학생 수 표시
         with col_1_1:
-            st.success(f"✨ 총 {len(roster_df)}명 학생이 불러와졌습니다! ")
+            st.success(f"✨ 총 {len(raw_df)}명 학생이 불러와졌습니다! ")
         with col_1_2:
             st.markdown(" ")
-            st.write(roster_df.head(3))
+            st.write(raw_df.head(3))
 
-        # 열 이름 '성명'을 '이름'으로 수정
-        if '성명' in roster_df.columns:
-            roster_df.rename(columns={'성명': '이름'}, inplace=True)
+        if renamed:
             st.success("✅ '성명' 열 이름이 '이름'으로 수정되었습니다.")
 
-        # 학번이 있는 경우 학년, 반, 번호로 분리
-        if '학번' in roster_df.columns:
+        if split:
             st.write("yes")
-            if '학년' in roster_df.columns:
-
-                roster_df = roster_df.drop(columns=['학년'])
-            roster_df['학년'] = roster_df['학번'].astype(str).str[0].astype(int)
-            roster_df['반'] = roster_df['학번'].astype(str).str[1:3].astype(int)
-            roster_df['번호'] = roster_df['학번'].astype(str).str[3:].astype(int)
             with col_1_2:
                 st.success("✅ '학번'이 '학년', '반', '번호'로 분리되었습니다.")
 
@@ -372,13 +1061,17 @@ if roster_file is not None:
             st.error(f"❌ 열 이름이 올바르지 않습니다! 다음 열이 필요합니다: {', '.join(missing_columns)}")
             st.stop()  # 오류 발생 시 실행 중지
 
-        # 열 순서 정렬
-        roster_df = roster_df[['학년', '반', '번호', '이름']]
         st.session_state.roster_df = roster_df
 
         # 최종 미리보기 출력
         with st.expander("📋 전처리된 학생 명단 확인"):
             st.dataframe(roster_df.head(5))
+            st.download_button(
+                label="💾 명렬표 체크포인트 다운로드",
+                data=load_roster_checkpoint(roster_file.getvalue()),
+                file_name="명렬표_체크포인트.zip",
+                mime="application/zip"
+            )
 
     except Exception as e:
         st.error("❌ 파일 처리 중 오류가 발생했습니다. 올바른 엑셀 파일인지 확인해주세요.")
@@ -392,26 +1085,86 @@ else:
 st.subheader("2️⃣ 특기사항 파일들 업로드")
 
 uploaded_files = st.file_uploader("특기사항 엑셀 파일 업로드 (여러개 가능)", type=["xls","xlsx"], accept_multiple_files=True, key=f"file_uploader_{st.session_state.uploader_key}")
+dedupe_mode = st.radio(
+    "🔁 같은 학생의 같은 영역에 중복 기재가 있을 때",
+    list(DEDUPE_MODES.keys()),
+    horizontal=True,
+    help="완전 중복: 기재내용이 똑같은 경우 / 유사 중복: 띄어쓰기, 문장부호만 다른 경우. 처음 나온 기재는 남깁니다."
+)
+batch_mode = st.checkbox(
+    "🧰 일괄 처리 모드: 오류가 있는 파일/시트는 건너뛰고 나머지를 계속 처리",
+    help="건너뛴 파일은 오류 목록에 표시됩니다. 문제 파일만 고쳐서 다시 올리면, 나머지 파일은 이전 결과를 재사용합니다."
+)
 if uploaded_files:
     st.session_state.uploaded_files = uploaded_files
-    output, processed_files_data = process_uploaded_files(uploaded_files)
-    if output and processed_files_data:
-        st.session_state.step1_data = output
-        st.session_state.processed_files_data = processed_files_data
-        st.success("👏 파일 업로드 및 통합 완료")
-    else:
-        st.error("파일 처리 오류 발생")
+
+    # 사전 점검: 본격적으로 파싱하기 전에 파일명, 시트, 머리글 확인
+    preflight_issues, preflight_sheets = preflight_check(uploaded_files)
+    blocked_files = {issue["파일"] for issue in preflight_issues if issue["수준"] == "오류"}
+    with st.expander(f"🔎 사전 점검 결과 (파일 {len(uploaded_files)}개, 시트 {len(preflight_sheets)}개)", expanded=bool(preflight_issues)):
+        if preflight_issues:
+            st.table(preflight_issues)
+        st.dataframe(preflight_sheets, height=200)
+
+    files_to_process = [f for f in uploaded_files if f.name not in blocked_files]
+    if blocked_files and not batch_mode:
+        st.error(f"🚨 사전 점검에서 {len(blocked_files)}개 파일에 오류가 있어 처리를 시작하지 않았습니다. 파일을 고치거나 일괄 처리 모드를 켜서 해당 파일을 제외하고 처리하세요.")
+        files_to_process = []
+        # 이전 업로드의 결과가 남아 보이지 않도록 정리
+        if st.session_state.pipeline_job is not None:
+            st.session_state.pipeline_job.cancel()
+            st.session_state.pipeline_job = None
+        reset_pipeline_state()
+    elif blocked_files:
+        st.warning(f"⚠️ 사전 점검에서 오류가 난 {len(blocked_files)}개 파일을 제외하고 처리합니다.")
+
+    job = None
+    if files_to_process:
+        # 업로드 파일과 명렬표의 내용이 바뀌었을 때만 새 작업 제출
+        job_key = (
+            tuple((f.name, file_digest(f.getvalue())) for f in files_to_process),
+            None if roster_file is None else file_digest(roster_file.getvalue()),
+            dedupe_mode,
+            batch_mode,
+        )
+        job = show_pipeline_job(job_key, run_pipeline, files_to_process, st.session_state.roster_df, dedupe_mode, batch_mode)
+
+    processed_files_data = st.session_state.processed_files_data
+    if job is not None and job.collected:
+        if st.session_state.step1_data and processed_files_data:
+            st.success("👏 파일 업로드 및 통합 완료")
+        else:
+            st.error("파일 처리 오류 발생")
+
+        # 일괄 처리 모드에서 건너뛴 파일/시트 목록
+        if st.session_state.error_report:
+            st.warning(f"⚠️ {len(st.session_state.error_report)}개의 파일/시트에서 오류가 발생해 건너뛰고 처리했습니다. 해당 파일만 고쳐서 다시 올려주세요.")
+            with st.expander("🧾 건너뛴 파일/시트 오류 목록"):
+                st.table([{k: v for k, v in issue.items() if k != "상세"} for issue in st.session_state.error_report])
+                for issue in st.session_state.error_report:
+                    st.text(f"[{issue['단계']}] {issue['파일']} {issue['시트']}\n{issue['상세']}")
 
     # 업로드한 모든 파일을 tabs로 보기
-    tab_names = [f"▸{name.split('_')[1]}" for name in processed_files_data.keys()]
-    tabs = st.tabs(tab_names) 
-    for i, (file_name, sheet_dfs) in enumerate(processed_files_data.items()):
-        with tabs[i]:
-            # st.write(f"**{file_name} 처리 결과**")
-            for sheet_name, df in sheet_dfs:
-                n, m = df.shape
-                st.info(f"파일명 : {file_name}....총 **{n}명** ")
-                st.dataframe(df, height=200)
+    if job is not None and job.collected and processed_files_data:
+        tab_names = [f"▸{name.split('_')[1]}" for name in processed_files_data.keys()]
+        tabs = st.tabs(tab_names) 
+        for i, (file_name, sheet_dfs) in enumerate(processed_files_data.items()):
+            with tabs[i]:
+                # st.write(f"**{file_name} 처리 결과**")
+                for sheet_name, df in sheet_dfs:
+                    n, m = df.shape
+                    st.info(f"파일명 : {file_name}....총 **{n}명** ")
+                    st.dataframe(df, height=200)
+else:
+    with st.expander("💾 체크포인트에서 이어서 처리하기", expanded=False):
+        checkpoint_files = st.file_uploader("2단계 또는 3단계 체크포인트 업로드 (.zip, 명렬표 체크포인트와 함께 올려도 됩니다)", type=["zip"], accept_multiple_files=True, key="checkpoint")
+    if checkpoint_files:
+        job_key = (
+            tuple(("checkpoint", f.name, file_digest(f.getvalue())) for f in checkpoint_files),
+            None if roster_file is None else file_digest(roster_file.getvalue()),
+            dedupe_mode,
+        )
+        show_pipeline_job(job_key, resume_pipeline, [f.getvalue() for f in checkpoint_files], st.session_state.roster_df, dedupe_mode)
 
 st.subheader("3️⃣ 엑셀파일 처리하기")
 
@@ -422,45 +1175,44 @@ step2_l, step2_r = st.columns([0.4, 0.6])
 with step2_l:
     st.write("##### 2단계: 하나의 시트로 만들기")
 
-if st.session_state.step1_data:
-    # 데이터 처리 시작
-    final_df = process_step2_data(st.session_state.step1_data)
-    if final_df is not None:
-        st.session_state.step2_data = final_df
-
-        # 처리 결과를 표시
-        with step2_r:
-            st.write("**📋 처리 결과 (미리보기)**")
-            st.dataframe(final_df, height=200)
-
-        # 결과 다운로드 버튼
-        output_step2 = BytesIO()
-        final_df.to_excel(output_step2, index=False, engine='xlsxwriter')
-        output_step2.seek(0)
-        with step2_l:
-            st.success("✅ **2단계 처리 완료!**")
-
-            # 기존 다운로드 버튼: 개별 시트로 나뉜 통합 문서
-            st.download_button(
-                label="📥 2단계 결과 다운로드 (개별 시트 버전)",
-                data=output_step2,
-                file_name="통합.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+if st.session_state.step2_data is not None:
+    final_df = st.session_state.step2_data
+    output_step2, output_single_sheet = st.session_state.step2_outputs
 
-            # 새로운 다운로드 버튼: 모든 데이터를 하나의 시트에 통합한 버전
-            output_single_sheet = BytesIO()
-            final_df.to_excel(output_single_sheet, index=False, sheet_name="모든 데이터")
-            output_single_sheet.seek(0)
+    # 처리 결과를 표시
+    with step2_r:
+        st.write("**📋 처리 결과 (미리보기)**")
+        st.dataframe(final_df.drop(columns=['출처'], errors='ignore'), height=200)
 
-            st.download_button(
-                label="📥 2단계 결과 다운로드 (단일 시트 버전)",
-                data=output_single_sheet,
-                file_name="통합_단일시트.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
-    else:
-        st.error("🚨 **2단계 처리 중 오류가 발생했습니다. 입력 데이터를 확인해주세요.**")
+    # 결과 다운로드 버튼
+    with step2_l:
+        st.success("✅ **2단계 처리 완료!**")
+
+        # 기존 다운로드 버튼: 개별 시트로 나뉜 통합 문서
+        st.download_button(
+            label="📥 2단계 결과 다운로드 (개별 시트 버전)",
+            data=output_step2,
+            file_name="통합.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+
+        # 새로운 다운로드 버튼: 모든 데이터를 하나의 시트에 통합한 버전
+        st.download_button(
+            label="📥 2단계 결과 다운로드 (단일 시트 버전)",
+            data=output_single_sheet,
+            file_name="통합_단일시트.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+
+        # 체크포인트: 다음에 3단계부터 이어서 처리할 때 사용
+        st.download_button(
+            label="💾 2단계 체크포인트 다운로드",
+            data=st.session_state.step2_checkpoint,
+            file_name="2단계_체크포인트.zip",
+            mime="application/zip"
+        )
+elif st.session_state.step1_data:
+    st.error("🚨 **2단계 처리 중 오류가 발생했습니다. 입력 데이터를 확인해주세요.**")
 else:
     with step2_l:
         st.warning("⚠️ **1단계 결과가 없습니다. 먼저 파일을 업로드하고 통합해주세요.**")
@@ -471,34 +1223,42 @@ step3_l, step3_r = st.columns([0.4, 0.6])
 with step3_l:
     st.write("##### 3단계: 영역별 피벗 테이블 생성")
 
-if st.session_state.step2_data is not None:
-    section_df_list = create_pivot_tables(st.session_state.step2_data)
-    if section_df_list:
-        st.session_state.step3_data = section_df_list
-
-        # 처리 결과 표시
-        for section_name, df in section_df_list:
-            with step3_r:
-                st.write("**📋 처리 결과 (미리보기)**")
-                st.dataframe(df.head(10), height=200)
-
-                # 결과 다운로드
-                output_step3 = BytesIO()
-                with pd.ExcelWriter(output_step3, engine="xlsxwriter") as writer:
-                    df.to_excel(writer, index=False, sheet_name="특기사항")
-                output_step3.seek(0)
-            with step3_l:
-                st.success("✅ **3단계 처리 완료!**")
-
-                st.download_button(
-                    label=f"📥 {section_name} 3단계 결과 다운로드",
-                    data=output_step3,
-                    file_name=f"{section_name}_피벗.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
-    else:
+duplicate_report = st.session_state.duplicate_report
+if duplicate_report is not None and not duplicate_report.empty:
+    with step3_l:
+        counts = duplicate_report['중복유형'].value_counts()
+        summary = ", ".join(f"{dup_type} {counts.get(dup_type, 0)}건" for dup_type in DUPLICATE_TYPES)
+        st.warning(f"🔁 같은 학생의 같은 영역에서 중복 기재가 발견되었습니다. ({summary}, 처리 방식: {dedupe_mode})")
+        with st.expander("🔍 중복 기재 목록 확인"):
+            st.dataframe(duplicate_report.drop(columns=['행']), height=200)
+
+if st.session_state.step3_data:
+    with step3_l:
+        # 체크포인트: 다음에 4단계부터 이어서 처리할 때 사용
+        st.download_button(
+            label="💾 3단계 체크포인트 다운로드",
+            data=st.session_state.step3_checkpoint,
+            file_name="3단계_체크포인트.zip",
+            mime="application/zip"
+        )
+
+    # 처리 결과 표시
+    for section_name, df in st.session_state.step3_data:
+        with step3_r:
+            st.write("**📋 처리 결과 (미리보기)**")
+            st.dataframe(df.head(10), height=200)
         with step3_l:
-            st.error("🚨 **3단계 처리 중 오류가 발생했습니다. 입력 데이터를 확인해주세요.**")
+            st.success("✅ **3단계 처리 완료!**")
+
+            st.download_button(
+                label=f"📥 {section_name} 3단계 결과 다운로드",
+                data=st.session_state.step3_outputs[section_name],
+                file_name=f"{section_name}_피벗.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
+elif st.session_state.step2_data is not None:
+    with step3_l:
+        st.error("🚨 **3단계 처리 중 오류가 발생했습니다. 입력 데이터를 확인해주세요.**")
 else:
     with step3_l:
         st.warning("⚠️ **2단계 결과가 없습니다. 먼저 데이터를 처리해주세요.**")
@@ -509,36 +1269,39 @@ step4_l, step4_r = st.columns([0.4, 0.6])
 with step4_l:
     st.write("##### 4단계: 최종본 생성 및 서식 추가")
 
-if st.session_state.roster_df is not None and st.session_state.step3_data:
-    updated_section_df_list = []
-    for section_name, df in st.session_state.step3_data:
-        temp_output, preview_data = add_excel_formulas(section_name, df)
-        if temp_output and preview_data is not None:
-            updated_section_df_list.append((section_name, preview_data))
-
-            with step4_r:
-                st.write("**📋 처리 결과 (미리보기)**")
-                st.dataframe(preview_data.head(10), height=200)
-
-                # 최종 결과 다운로드
-                temp_output.seek(0)
-                kst = pytz.timezone('Asia/Seoul')
-                current_datetime_kst = datetime.datetime.now(kst).strftime("%Y%m%d_%H%M")
-            with step4_l:
-                st.success("✅ **4단계 처리 완료! 최종본이 생성되었습니다.**")
-
-                st.download_button(
-                    label=f"📥 {section_name} 최종본 다운로드",
-                    data=temp_output,
-                    file_name=f"{section_name}_최종본_{current_datetime_kst}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
+if st.session_state.step4_outputs:
+    for section_name, temp_output, preview_data in st.session_state.step4_outputs:
+        with step4_r:
+            st.write("**📋 처리 결과 (미리보기)**")
+            st.dataframe(preview_data.head(10), height=200)
 
-    st.session_state.step4_data = updated_section_df_list
+            # 최종 결과 다운로드
+            temp_output.seek(0)
+            kst = pytz.timezone('Asia/Seoul')
+            current_datetime_kst = datetime.datetime.now(kst).strftime("%Y%m%d_%H%M")
+        with step4_l:
+            st.success("✅ **4단계 처리 완료! 최종본이 생성되었습니다.**")
+
+            st.download_button(
+                label=f"📥 {section_name} 최종본 다운로드",
+                data=temp_output,
+                file_name=f"{section_name}_최종본_{current_datetime_kst}.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
 else:
     with step4_l:
         st.warning("⚠️ **3단계 결과 또는 학생 명렬표가 없습니다. 데이터를 확인해주세요.**")
 
+if st.session_state.memory_report:
+    with st.expander("📊 단계별 메모리 사용량", expanded=False):
+        for stage, memory_mb in st.session_state.memory_report:
+            st.write(f"{stage}: **{memory_mb:.1f}MB**")
+
+if warm_up_timings:
+    with st.expander("⏱️ 서버 시작 시 라이브러리 불러오기 시간", expanded=False):
+        for module_name, seconds in list(warm_up_timings.items()):
+            st.write(f"{module_name}: **{seconds * 1000:.0f}ms**")
+
 
 st.markdown("---")
 st.markdown("""